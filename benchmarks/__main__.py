@@ -0,0 +1,59 @@
+"""
+python -m benchmarks run [-o results.json] [-c case,...] [--seed 0] [--repeat 5]
+python -m benchmarks compare old.json new.json [--threshold 0.1]
+"""
+import json
+import optparse
+import sys
+
+from benchmarks import suite
+
+
+def parse_args(args):
+    usage = "usage: %prog run [options] | %prog compare old.json new.json [options]"
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option('-o', action="store", type="string",
+                      dest="output",
+                      help="File the results of run are saved to",
+                      default="benchmark.json")
+    parser.add_option('-c', action="store", type="string",
+                      dest="cases",
+                      help="Comma separated cases to run, all of them by default: " + ", ".join(suite.CASES),
+                      default="")
+    parser.add_option('--seed', action="store", type="int",
+                      dest="seed",
+                      help="Seed of every case",
+                      default=0)
+    parser.add_option('--repeat', action="store", type="int",
+                      dest="repeat",
+                      help="Timed runs of each case",
+                      default=5)
+    parser.add_option('--threshold', action="store", type="float",
+                      dest="threshold",
+                      help="Relative growth of time or memory compare reports as a regression",
+                      default=0.1)
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    opt, args = parse_args(sys.argv[1:])
+
+    if args[:1] == ["run"]:
+        names = [name for name in opt.cases.split(",") if name]
+        results = suite.run_suite(names, opt.seed, opt.repeat)
+        suite.save(results, opt.output)
+        print(f"Results saved to {opt.output}")
+    elif args[:1] == ["compare"] and len(args) == 3:
+        with open(args[1]) as f:
+            old = json.load(f)
+        with open(args[2]) as f:
+            new = json.load(f)
+        lines, regressions = suite.compare(old, new, opt.threshold)
+        print(*lines, sep="\n")
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,211 @@
+"""
+Benchmarks of the generation pipeline on fixed seeds.
+
+Every case prepares its input untimed, then runs one stage. A case is run
+`repeat` times for the wall time and once more under tracemalloc for the
+peak memory, so tracing doesn't slow down the timed runs. Operations per
+second count the case's own unit (maps read, points selected, levels
+generated...) per median run.
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from generator import level_generation
+from generator import point_selection
+from generator import structure_creation
+from generator import structure_identification
+from generator import structure_matching
+from metrics.level_analysis import calculate_leniency, calculate_linearity, calculate_line_distance
+from tools.render_level.render_level import render_structure
+
+MAP = "maps/lvl-1.txt"
+N = 35
+D = 4
+
+
+def rngs(seed):
+    return random.Random(seed), np.random.default_rng(seed)
+
+
+def library(seed):
+    """Structures of MAP with their combinations, as main.py builds them"""
+    structure_creation.structure_id = 1
+    structures = structure_identification.extract_structures(MAP, N, D, rng=random.Random(seed),
+                                                             np_rng=np.random.default_rng(seed))
+    g_s, g_f = level_generation.instantiate_base_level(len(structures) + 1)
+    structure_matching.compute_combinations(structures + [g_s, g_f])
+    return g_s, g_f, structures
+
+
+def level_matrix(seed, minimum_count=35):
+    g_s, g_f, structures = library(seed)
+    level = level_generation.generate_level(structures, g_s, g_f, minimum_count, random.Random(seed))[0]
+    return level.matrix_representation()
+
+
+def read_level(seed):
+    return lambda: structure_identification.read_level(MAP), 1
+
+
+def spaced_selection(seed):
+    map_data = structure_identification.read_level(MAP)
+
+    def run():
+        rng, np_rng = rngs(seed)
+        point_selection.spaced_selection(map_data, N, D, rng, np_rng)
+    return run, N
+
+
+def evenly_spaced_selection(seed):
+    map_data = structure_identification.read_level(MAP)
+    return lambda: point_selection.evenly_spaced_selection(map_data, N), N
+
+
+def create(seed):
+    map_data = structure_identification.read_level(MAP)
+    points = point_selection.spaced_selection(map_data, N, D, *rngs(seed))
+
+    def run():
+        structure_creation.structure_id = 1
+        structure_creation.create(map_data, points, D)
+    return run, len(points)
+
+
+def compute_combinations(seed):
+    structure_creation.structure_id = 1
+    rng, np_rng = rngs(seed)
+    structures = structure_identification.extract_structures(MAP, N, D, rng=rng, np_rng=np_rng)
+    g_s, g_f = level_generation.instantiate_base_level(len(structures) + 1)
+    structures = structures + [g_s, g_f]
+
+    def run():
+        # combinations are appended to the connectors, start from none every time
+        for s in structures:
+            for sub_id in range(s.sub_id):
+                s.combinable[sub_id].clear()
+                s.placements[sub_id].clear()
+        structure_matching.compute_combinations(structures)
+    return run, len(structures)
+
+
+def generate_level(minimum_count):
+    def case(seed):
+        g_s, g_f, structures = library(seed)
+
+        def run():
+            level_generation.generate_level(structures, g_s, g_f, minimum_count, random.Random(seed))
+        return run, 1
+    return case
+
+
+def metrics(seed):
+    level_data = level_matrix(seed)
+
+    def run():
+        calculate_leniency(level_data)
+        calculate_linearity(level_data)
+        calculate_line_distance(level_data)
+    return run, 1
+
+
+def render(seed):
+    level_data = level_matrix(seed)
+    path = os.path.join(tempfile.mkdtemp(), "level.png")
+    return lambda: render_structure(level_data, path), 1
+
+
+CASES = {
+    "read_level": read_level,
+    "spaced_selection": spaced_selection,
+    "evenly_spaced_selection": evenly_spaced_selection,
+    "structure_creation.create": create,
+    "compute_combinations": compute_combinations,
+    "generate_level.m10": generate_level(10),
+    "generate_level.m20": generate_level(20),
+    "generate_level.m35": generate_level(35),
+    "metrics": metrics,
+    "render_structure": render,
+}
+
+
+def measure(case, seed, repeat):
+    # the stages print as they go, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        run, ops = case(seed)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    median = statistics.median(times)
+    return {
+        "median_seconds": median,
+        "min_seconds": min(times),
+        "repeat": repeat,
+        "peak_bytes": peak,
+        "ops": ops,
+        "ops_per_second": ops / median if median > 0 else None,
+    }
+
+
+def run_suite(names=None, seed=0, repeat=5):
+    """Run the named cases (every case by default) and return the results"""
+    results = {}
+    for name in names or CASES:
+        results[name] = measure(CASES[name], seed, repeat)
+        print("{:<28} {:>10.4f}s {:>12.1f} ops/s {:>10.1f} KiB".format(
+            name, results[name]["median_seconds"], results[name]["ops_per_second"] or 0,
+            results[name]["peak_bytes"] / 1024))
+    return {
+        "seed": seed,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cases": results,
+    }
+
+
+def save(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def compare(old, new, threshold=0.1):
+    """
+    Compare two result files, returning the lines of the report and the
+    cases whose median time or peak memory grew by more than threshold
+    """
+    lines = []
+    regressions = []
+    for name, after in new["cases"].items():
+        before = old["cases"].get(name)
+        if before is None:
+            lines.append("{:<28} new".format(name))
+            continue
+        time_ratio = after["median_seconds"] / before["median_seconds"] if before["median_seconds"] else 1
+        memory_ratio = after["peak_bytes"] / before["peak_bytes"] if before["peak_bytes"] else 1
+        flags = []
+        if time_ratio > 1 + threshold:
+            flags.append("SLOWER")
+        if memory_ratio > 1 + threshold:
+            flags.append("MORE MEMORY")
+        if flags:
+            regressions.append(name)
+        lines.append("{:<28} time x{:.2f} memory x{:.2f} {}".format(name, time_ratio, memory_ratio, " ".join(flags)))
+    return lines, regressions
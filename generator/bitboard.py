@@ -0,0 +1,103 @@
+"""
+Column bitboards of 16-row levels.
+
+Each column is a uint16 with bit r set when row r holds something, so whole
+columns are tested, shifted and merged with integer operations. A level in
+progress keeps two such boards: the cells holding any tile and the cells
+whose first tile is explicit air ('-').
+"""
+import numpy as np
+
+from .level import reserve
+
+N_ROWS = 16
+
+
+def pack(rows, cols, n_cols):
+    """Bitboard of the cells at (rows, cols), for columns 0..n_cols-1"""
+    masks = np.zeros(n_cols, dtype=np.uint16)
+    np.bitwise_or.at(masks, np.asarray(cols, dtype=np.intp),
+                     np.left_shift(1, np.asarray(rows, dtype=np.intp)).astype(np.uint16))
+    return masks
+
+
+def from_grid(grid):
+    """Bitboard of a row-major boolean grid. Grids taller than 16 rows use uint64 columns"""
+    grid = np.asarray(grid, dtype=bool)
+    dtype = np.uint16 if grid.shape[0] <= N_ROWS else np.uint64
+    bits = np.left_shift(np.ones(1, dtype=dtype), np.arange(grid.shape[0], dtype=dtype))
+    return (grid * bits[:, None]).sum(axis=0, dtype=dtype)
+
+
+def span(row_min, row_max):
+    """Mask of the rows row_min..row_max, clipped to the 16 level rows"""
+    row_min, row_max = max(row_min, 0), min(row_max, N_ROWS - 1)
+    if row_min > row_max:
+        return 0
+    return ((1 << (row_max + 1)) - 1) ^ ((1 << row_min) - 1)
+
+
+def shift(masks, dr):
+    """Move every column down by dr rows (up when negative), dropping rows that leave the level"""
+    if dr == 0:
+        return masks
+    if abs(dr) >= N_ROWS:
+        return np.zeros_like(masks)
+    return np.left_shift(masks, dr) if dr > 0 else np.right_shift(masks, -dr)
+
+
+def row(masks, r):
+    """Whether each column has row r set"""
+    return (np.right_shift(masks, r) & 1).astype(bool)
+
+
+def top_row(masks):
+    """Row of the top-most set bit of each column, -1 for empty columns"""
+    masks = masks.astype(np.uint64)
+    lowest = masks & (~masks + np.uint64(1))
+    return np.where(masks > 0, np.log2(np.maximum(lowest, 1)).astype(np.intp), -1)
+
+
+class Bitboard:
+    """The filled and first-air bitboards of a level that is being generated"""
+
+    def __init__(self, n_cols=64):
+        self.filled = np.zeros(n_cols, dtype=np.uint16)
+        self.air = np.zeros(n_cols, dtype=np.uint16)
+        self._log = []
+
+    def __len__(self):
+        return len(self._log)
+
+    def _reserve(self, n_cols):
+        self.filled = reserve(self.filled, n_cols)
+        self.air = reserve(self.air, n_cols)
+
+    def push(self, footprint):
+        """
+        Write a footprint and return the mask of the columns where it
+        overlaps earlier cells and either tile is air, starting at its col_min
+        """
+        if footprint.col_max < footprint.col_min:
+            self._log.append((0, self.filled[:0].copy(), self.air[:0].copy()))
+            return footprint.masks
+        start, end = footprint.col_min, footprint.col_max + 1
+        self._reserve(end)
+        filled, air = self.filled[start:end].copy(), self.air[start:end].copy()
+        self._log.append((start, filled, air))
+
+        collisions = footprint.masks & filled & (footprint.air | air)
+        self.air[start:end] |= footprint.air & ~filled
+        self.filled[start:end] |= footprint.masks
+        return collisions
+
+    def pop(self):
+        """Undo the latest push"""
+        start, filled, air = self._log.pop()
+        self.filled[start:start + len(filled)] = filled
+        self.air[start:start + len(air)] = air
+
+    def any_filled(self, row_min, row_max, col_min, col_max):
+        """Check whether any cell of the rectangle is filled"""
+        col_min = max(col_min, 0)
+        return bool((self.filled[col_min:col_max + 1] & span(row_min, row_max)).any())
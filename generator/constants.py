@@ -1,43 +1,78 @@
-platform_tiles = ["X", '#', 't', "Q", "S", "?", "U", "%",
-                  "b", "*", "B", "U", "1", "2"]
-enemy_tiles = ["y", "Y", "E", "g", "k", "K", "r"]
+import numpy as np
 
-coin_tiles = ["Q", "!", "2", "C", "o"]
-
-powerup_tiles = ["?", "@"]
+# Tile categories, combined as bit flags in the symbol table below
+SOLID = 1
+ENEMY = 2
+COIN = 4
+POWERUP = 8
 
 """
-Symbol Reference:
-'M': Mario Starting Position, not having it will force the engine to start at x = 0 and the first ground floor.
-'F': Mario finish line, not having it will force the engine to end at x = levelWidth and the first ground floor.
-'y': Spiky
-'Y': Winged Spiky
-'E' or 'g': Goomba
-'G': Winged Goomba
-'k': Green Koopa
-'K': Winged Green Koopa
-'r': Red Koopa
-'X': Ground Block
-'#': Pyramind Block
-'%': Jump through platform
-'|': Background for the jump through platform
-'': Bullet bill where the top '' will be the bullet bill head
-'B': Bullet bill head
-'b': Bullet bill neck or body
-'?' or '@': Special Question block
-'Q' or '!': Coin Question block
-'1': Invisible 1 up block
-'2': Invisible coin bock
-'D': Used block
-'S': Normal Brick Block
-'C': Coing Brick Block
-'U': Musrhoom Brick Block
-'L': 1 up Block
-'o': Coin
-'t': Empty Pipe
-'T': Pipe with Piranaha Plant in it 
-'<': Top left of empty pipe
-'>': Top right of empty pipe
-'[': Left of empty pipe
-']': Right of empty pipe
+Symbol Reference: (symbol, categories, description)
+A tile's code is the byte value of its symbol, so a grid of codes turns back
+into level text with a single tobytes() and can be classified by indexing
+the lookup arrays below, e.g. is_enemy[grid].
 """
+TILES = (
+    ("M", 0, "Mario Starting Position, not having it will force the engine to start at x = 0 and the first ground floor."),
+    ("F", 0, "Mario finish line, not having it will force the engine to end at x = levelWidth and the first ground floor."),
+    ("-", 0, "Air"),
+    ("y", ENEMY, "Spiky"),
+    ("Y", ENEMY, "Winged Spiky"),
+    ("E", ENEMY, "Goomba"),
+    ("g", ENEMY, "Goomba"),
+    ("G", 0, "Winged Goomba"),
+    ("k", ENEMY, "Green Koopa"),
+    ("K", ENEMY, "Winged Green Koopa"),
+    ("r", ENEMY, "Red Koopa"),
+    ("X", SOLID, "Ground Block"),
+    ("#", SOLID, "Pyramind Block"),
+    ("%", SOLID, "Jump through platform"),
+    ("|", 0, "Background for the jump through platform"),
+    ("*", SOLID, "Bullet bill where the top '*' will be the bullet bill head"),
+    ("B", SOLID, "Bullet bill head"),
+    ("b", SOLID, "Bullet bill neck or body"),
+    ("?", SOLID | POWERUP, "Special Question block"),
+    ("@", POWERUP, "Special Question block"),
+    ("Q", SOLID | COIN, "Coin Question block"),
+    ("!", COIN, "Coin Question block"),
+    ("1", SOLID, "Invisible 1 up block"),
+    ("2", SOLID | COIN, "Invisible coin bock"),
+    ("D", 0, "Used block"),
+    ("S", SOLID, "Normal Brick Block"),
+    ("C", COIN, "Coing Brick Block"),
+    ("U", SOLID, "Musrhoom Brick Block"),
+    ("L", 0, "1 up Block"),
+    ("o", COIN, "Coin"),
+    ("t", SOLID, "Empty Pipe"),
+    ("T", 0, "Pipe with Piranaha Plant in it"),
+    ("<", 0, "Top left of empty pipe"),
+    (">", 0, "Top right of empty pipe"),
+    ("[", 0, "Left of empty pipe"),
+    ("]", 0, "Right of empty pipe"),
+)
+
+CODES = {symbol: ord(symbol) for symbol, _, _ in TILES}
+AIR = CODES["-"]
+
+
+def lookup_table(symbols):
+    """Return a boolean array indexed by tile code, True for the given symbols"""
+    table = np.zeros(256, dtype=bool)
+    table[[ord(s) for s in symbols]] = True
+    return table
+
+
+def _symbols(category):
+    return frozenset(symbol for symbol, categories, _ in TILES if categories & category)
+
+
+platform_tiles = _symbols(SOLID)
+enemy_tiles = _symbols(ENEMY)
+coin_tiles = _symbols(COIN)
+powerup_tiles = _symbols(POWERUP)
+
+is_solid = lookup_table(platform_tiles)
+is_enemy = lookup_table(enemy_tiles)
+is_coin = lookup_table(coin_tiles)
+is_powerup = lookup_table(powerup_tiles)
+is_air = lookup_table("-")
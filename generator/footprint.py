@@ -0,0 +1,95 @@
+"""
+Bounding boxes and per-column occupancy masks of structures and placements.
+
+Levels are 16 rows tall, so the cells a structure covers in one column fit
+in a uint16 with bit r set for row r (see bitboard). Overlap tests reject
+on the bounding box first and only AND the masks of the columns both sides
+share. air holds the subset of masks whose tile is explicit air.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from . import bitboard
+from . import constants
+
+Footprint = namedtuple("Footprint", ["row_min", "row_max", "col_min", "col_max", "masks", "air"])
+
+EMPTY = Footprint(0, -1, 0, -1, np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.uint16))
+
+
+def of_cells(rows, cols, codes=None):
+    """
+    Footprint of cells given as arrays of rows and columns, ignoring rows
+    outside of [0, 15]. Tile codes, if given, fill in the air masks.
+    """
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    inside = (rows >= 0) & (rows <= 15)
+    if not inside.all():
+        rows, cols = rows[inside], cols[inside]
+        codes = codes[inside] if codes is not None else None
+    if len(rows) == 0:
+        return EMPTY
+    col_min, col_max = int(cols.min()), int(cols.max())
+
+    n_cols = col_max - col_min + 1
+    masks = bitboard.pack(rows, cols - col_min, n_cols)
+    if codes is None:
+        air = np.zeros(n_cols, dtype=np.uint16)
+    else:
+        is_air = np.asarray(codes) == constants.AIR
+        air = bitboard.pack(rows[is_air], cols[is_air] - col_min, n_cols)
+    return Footprint(int(rows.min()), int(rows.max()), col_min, col_max, masks, air)
+
+
+def box(row_min, row_max, col_min, col_max):
+    """Footprint of a rectangle, clipped to the 16 level rows"""
+    row_min, row_max = max(row_min, 0), min(row_max, 15)
+    if row_min > row_max or col_max < col_min:
+        return EMPTY
+    n_cols = col_max - col_min + 1
+    masks = np.full(n_cols, bitboard.span(row_min, row_max), dtype=np.uint16)
+    return Footprint(row_min, row_max, col_min, col_max, masks, np.zeros(n_cols, dtype=np.uint16))
+
+
+def shifted(footprint, dr, dc):
+    """
+    Move a footprint by (dr, dc), dropping the cells that leave the 16 level
+    rows but keeping columns left of 0, so it can be moved again later
+    """
+    if footprint.col_max < footprint.col_min:
+        return footprint
+    row_min, row_max = max(footprint.row_min + dr, 0), min(footprint.row_max + dr, 15)
+    if row_max < row_min:
+        return EMPTY
+    return Footprint(row_min, row_max, footprint.col_min + dc, footprint.col_max + dc,
+                     bitboard.shift(footprint.masks, dr), bitboard.shift(footprint.air, dr))
+
+
+def translate(footprint, dr, dc):
+    """
+    Move a footprint by (dr, dc), dropping the cells that leave the 16 level
+    rows or end up left of column 0
+    """
+    footprint = shifted(footprint, dr, dc)
+    if footprint.col_min >= 0:
+        return footprint
+    if footprint.col_max < 0:
+        return EMPTY
+    return footprint._replace(col_min=0, masks=footprint.masks[-footprint.col_min:],
+                              air=footprint.air[-footprint.col_min:])
+
+
+def bbox_overlap(a, b):
+    return not (a.col_max < b.col_min or b.col_max < a.col_min or
+                a.row_max < b.row_min or b.row_max < a.row_min)
+
+
+def overlap(a, b):
+    """Check whether two footprints share a cell"""
+    if not bbox_overlap(a, b):
+        return False
+    start, end = max(a.col_min, b.col_min), min(a.col_max, b.col_max) + 1
+    shared = a.masks[start - a.col_min:end - a.col_min] & b.masks[start - b.col_min:end - b.col_min]
+    return bool(shared.any())
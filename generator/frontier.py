@@ -0,0 +1,71 @@
+import random
+
+
+class Frontier:
+    """The open (placement index, sub_id, structure id, sub_id) substitutions of a level in progress"""
+
+    def __init__(self, terminal_ids=()):
+        self.terminal_ids = set(terminal_ids)  # g_s and g_f, substitutions towards them are never sampled
+        self._items = []  # substitutions that can be sampled
+        self._positions = {}  # substitution -> index in _items
+        self._terminal = set()
+        self._connectors = {}  # (placement index, sub_id) -> substitutions
+
+    def __len__(self):
+        return len(self._items) + len(self._terminal)
+
+    def n_usable(self):
+        return len(self._items)
+
+    def __contains__(self, substitution):
+        return substitution in self._positions or substitution in self._terminal
+
+    def only_connector(self, index, sub_id):
+        """Check whether every substitution left belongs to the given connector"""
+        left = sum(substitution in self for substitution in self._connectors.get((index, sub_id), ()))
+        return left == len(self)
+
+    def substitutions(self, index, sub_id):
+        """Return the substitutions of an open connector, None if it is closed"""
+        return self._connectors.get((index, sub_id))
+
+    def sample(self, rng=random):
+        return rng.choice(self._items)
+
+    def _add(self, substitution):
+        if substitution[2] in self.terminal_ids:
+            self._terminal.add(substitution)
+        else:
+            self._positions[substitution] = len(self._items)
+            self._items.append(substitution)
+
+    def discard(self, substitution):
+        """Remove a substitution in O(1) by moving the last item into its slot"""
+        position = self._positions.pop(substitution, None)
+        if position is None:
+            self._terminal.discard(substitution)
+            return
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._positions[last] = position
+
+    def open(self, level, index, sub_id):
+        """Add every remaining candidate of a connector"""
+        substitutions = [(index, sub_id, s_id, n2) for s_id, n2 in level[index].combinable(sub_id)]
+        self._connectors[(index, sub_id)] = substitutions
+        for substitution in substitutions:
+            self._add(substitution)
+
+    def close(self, index, sub_id):
+        """Remove every candidate of a connector"""
+        for substitution in self._connectors.pop((index, sub_id), ()):
+            self.discard(substitution)
+
+    def open_placement(self, level, index):
+        for sub_id in level[index].open_connectors():
+            self.open(level, index, sub_id)
+
+    def close_placement(self, placement, index):
+        for sub_id in range(placement.template.sub_id):
+            self.close(index, sub_id)
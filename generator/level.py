@@ -1,77 +1,133 @@
-import math
+import numpy as np
+
+from . import tile_codec
+
+
+def reserve(buffer, n_cols, fill=0):
+    """
+    Return buffer if it has at least n_cols columns (its first axis), or a
+    copy whose capacity doubled until it does, the new columns set to fill
+    """
+    capacity = max(len(buffer), 1)
+    if n_cols <= len(buffer):
+        return buffer
+    while capacity < n_cols:
+        capacity *= 2
+    grown = np.full((capacity,) + buffer.shape[1:], fill, dtype=buffer.dtype)
+    grown[:len(buffer)] = buffer
+    return grown
 
 
 class Level:
+    """
+    A 16-row tile map backed by a column-major uint8 array.
 
-    def __init__(self, filler="-"):
-        self.map_data = []
+    Tiles are stored as their byte value, one column per array row, so
+    grid[c] holds the 16 tiles of column c from top to bottom. Columns are
+    preallocated and the buffer doubles whenever a write goes past it.
+    """
+
+    def __init__(self, filler="-", n_cols=1):
         self.n_rows = 16
-        self.n_cols = 1
+        self.n_cols = n_cols
         self.filler = filler
+        self._filler_code = ord(filler)
+        self._size = self.n_rows * n_cols  # number of appended cells
+        self._grid = np.full((max(n_cols, 16), self.n_rows), self._filler_code, dtype=np.uint8)
+
+    @property
+    def columns(self):
+        """Read-only (n_cols, 16) view of the map, indexed [column, row]"""
+        view = self._grid[:self.n_cols]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def rows(self):
+        """Read-only (16, n_cols) view of the map, indexed [row, column]"""
+        return self.columns.T
 
-        for r in range(self.n_rows):  # * self.n_cols):
-            self.map_data.append(filler)
+    def _reserve(self, n_cols):
+        self._grid = reserve(self._grid, n_cols, self._filler_code)
+
+    def grow(self, n_cols):
+        """Extend the level to at least n_cols full columns, padding with the filler"""
+        n_cols = max(n_cols, self.n_cols)
+        self._reserve(n_cols)
+        self.n_cols = n_cols
+        self._size = self.n_rows * n_cols
+
+    def truncate(self, n_cols):
+        """Shrink the level back to n_cols columns"""
+        n_cols = min(n_cols, self.n_cols)
+        self._grid[n_cols:self.n_cols] = self._filler_code
+        self.n_cols = n_cols
+        self._size = self.n_rows * n_cols
+
+    def copy(self):
+        other = Level.__new__(Level)
+        other.__dict__.update(self.__dict__)
+        other._grid = self._grid.copy()
+        return other
 
     def append(self, value):
-        self.map_data.append(value)
-        self.n_cols = math.ceil(len(self.map_data) / self.n_rows)
+        """Append a single tile, filling the map column by column"""
+        c, r = divmod(self._size, self.n_rows)
+        self._reserve(c + 1)
+        self._grid[c, r] = ord(value)
+        self._size += 1
+        self.n_cols = c + 1
 
     def get(self, x, y):
-        if x > self.n_rows or y > self.n_cols:
-            raise "Accessing invalid index"
-        index = self.n_rows * y + x
-        return self.map_data[index]
+        if x < 0 or y < 0 or x >= self.n_rows or y >= self.n_cols:
+            raise IndexError("Accessing invalid index ({}, {})".format(x, y))
+        return chr(self._grid[y, x])
 
     def set(self, x, y, value):
-        # print("Adding x {}, y {}".format(x, y))
-        if x > self.n_rows or x < 0 or y < 0:
-            # raise "Accessing invalid index"
+        if x >= self.n_rows or x < 0 or y < 0:
             return
-        # print("Current number of columns: {}, total: {}".format(self.n_cols, len(self.map_data)))
+        self.grow(y + 1)
+        self._grid[y, x] = ord(value)
 
-        while len(self.map_data) - 1 < self.n_rows * y + x:
-            self.append(self.filler)
+    def set_many(self, rows, cols, tiles):
+        """
+        Bulk version of set. tiles is either a sequence of one-character
+        strings or an array of tile codes. Positions outside of the map are
+        skipped and later entries win on duplicated positions.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        cols = np.asarray(cols, dtype=np.intp)
+        if not isinstance(tiles, np.ndarray):
+            tiles = tile_codec.codes_of(tiles)
+
+        inside = (rows >= 0) & (rows < self.n_rows) & (cols >= 0)
+        if not inside.all():
+            rows, cols, tiles = rows[inside], cols[inside], tiles[inside]
+        if len(cols) == 0:
+            return
 
-        while len(self.map_data) % 16 != 0:
-            self.append(self.filler)
+        self.grow(int(cols.max()) + 1)
+        self._grid[cols, rows] = tiles
 
-        # print("After appending: {}, total: {}".format(self.n_cols, len(self.map_data)))
+    def paste_grid(self, grid, col=0):
+        """Write a row-major (16, n) grid of tile codes starting at column col"""
+        n_cols = grid.shape[1]
+        self.grow(col + n_cols)
+        self._grid[col:col + n_cols] = np.asarray(grid, dtype=np.uint8).T
 
-        index = self.n_rows * y + x
-        # print("index: {}".format(index))
-        self.map_data[index] = value
+    def paste_structure(self, s):
+        """Write every node of structure s into the level"""
+        rows, cols = s.positions()
+        self.set_many(rows, cols, s.codes)
 
     def apply_structure(self, s):
-        for n in s.nodes:
-            x = n.r
-            y = n.c
-            self.set(x, y, n.tile)
+        self.paste_structure(s)
 
     def pretty_print(self):
-        full_string = ""
-        for i in range(self.n_rows):
-            row = ""
-            for j in range(self.n_cols):
-                tile = self.get(i, j)
-                row += str(tile)
-            full_string += row + "\n"
-            # print(row)
-        return full_string
+        return tile_codec.encode(self.rows)
 
     def matrix_representation(self):
-        level = []
-        for i in range(self.n_rows):
-            level.append([])
-            for j in range(self.n_cols):
-                level[-1].append(self.get(i, j))
-        return level
+        return tile_codec.to_matrix(self.rows)
 
     def save_level(self, level_filename="output.txt"):
-        output_file = open(level_filename, "w")
-        for r in range(self.n_rows):
-            string = ""
-            for c in range(self.n_cols):
-                tile = self.get(r, c)
-                string += str(tile)
-            print(string, sep='', file=output_file)
-        output_file.close()
+        tile_codec.write(self.rows, level_filename)
@@ -1,12 +1,20 @@
+import heapq
 import logging
 import random
-import copy
 import sys
+import time
 from . import constants
-from .scoring import get_density_score, get_increasing_density_score
-from .structure import Structure, Node, Connector
-from .level import Level
-
+from . import footprint
+from .scoring import DensityScorer
+from .structure import Structure, Node, Connector, combine
+from .placement import Placement
+from .frontier import Frontier
+from . import structure_matching
+from .nogood import NogoodCache
+from .occupancy import OccupancyGrid
+from .bitboard import Bitboard
+
+from helper.log import Lazy
 import new_logs
 from new_logs import my_loggers
 
@@ -14,115 +22,193 @@ logger = logging.getLogger(__name__)
 test_logger = logging.getLogger("logger")
 
 
-def print_level(structures):
-    directions = {"r": ">", "l": "<", "u": "^", "d": "v"}
-    level = Level()
-    base_structure = Structure(-1)
+def print_level(level):
+    return combine([p.structure() for p in level], connectors=True).pretty_print()
+
+
+def debug_level(message, level):
+    """Log the dump of level at DEBUG, drawn from copies of its placements as they keep changing"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, Lazy(print_level, [p.copy() for p in level]))
+
+
+def reopen(level, index, sub_id, frontier=None):
+    """Mark a connector as no longer combined and put its candidates back in the frontier"""
+    if level[index].combined.pop(sub_id, None) is not None and frontier is not None:
+        frontier.open(level, index, sub_id)
+
 
-    for s in structures:
-        base_structure.nodes.extend(s.nodes)
-        base_structure.connecting.extend(s.connecting)
-    return base_structure.pretty_print()
+def backtrack(level, frontier=None, grid=None, scorer=None):
+    removed = level.pop()
+    if frontier is not None:
+        frontier.close_placement(removed, len(level))
+    if grid is not None:
+        grid.pop()
+    if scorer is not None:
+        scorer.pop()
 
+    for sub_id, (index, c1_sub_id) in removed.combined.items():
+        logger.info("Clearing connectors associated with structure %s", removed.id)
+        if sub_id not in removed.disabled:
+            reopen(level, index, c1_sub_id, frontier)
+            logger.info("Clearing node %s from structure %s", c1_sub_id, level[index].id)
+    return level
 
-def backtrack(structures):
-    removed_structure = structures.pop()
 
-    for connector in removed_structure.connecting:
-        logger.info("Clearing connectors associated with structure {}".format(removed_structure.id))
-        if connector.combined != None:
-            structure1, c1 = connector.combined
-            c1.combined = None
-            logger.info("Clearing node {} from structure {}".format(c1.sub_id, structure1.id))
-    return structures
+# cells around a connector, as (row_min, row_max, col_min, col_max) offsets,
+# that must be empty for the connector to stay usable
+clearance = {
+    "r": (-1, 1, 0, 1),
+    "l": (-1, 1, -1, 0),
+    "u": (-1, 0, -1, 1),
+    "d": (0, 1, -1, 1)
+}
 
 
-def check_connectors(structures):
+def check_connectors(level, frontier=None, grid=None, owned=None):
     """
     Experimental function
-    Disable connectors that don't have sufficient space around them
+    Disable connectors that don't have sufficient space around them.
+    With an occupancy grid, only the connectors around the newest placement
+    and the ones never checked while open are looked at: the others were
+    checked against every earlier placement already.
+    owned holds the indices of the placements only this level uses, the
+    others are copied before being changed (see greed_search).
   """
-    level_matrix = {}
-    for str in structures:
-        for n in str.nodes:
-            if (n.r, n.c) not in level_matrix.keys():
-                level_matrix[(n.r, n.c)] = n.tile
-
-    # list of adjacent tiles to check
-    switcher = {
-        "r": [(0, 0), (1, 0), (-1, 0), (0, 1), (1, 1), (-1, 1)],
-        "l": [(0, 0), (1, 0), (-1, 0), (0, -1), (1, -1), (-1, -1)],
-        "u": [(0, 0), (0, -1), (0, 1), (-1, 0), (-1, -1), (-1, 1)],
-        "d": [(0, 0), (0, -1), (0, 1), (1, 0), (1, -1), (1, 1)]
-    }
-
-    for str in structures:
-        for c in reversed(str.connecting):
-            if c.combined == None:
-                for r_d, c_d in switcher[c.direction]:
-                    # we check if there are tiles in the adjacent positions
-                    if (c.r + r_d, c.c + c_d) in level_matrix.keys():
-                        logger.info("disabling connector at ({},{})".format(c.r, c.c))
-                        # c.combined = -1
-                        str.connecting.remove(c)
-                        break
-
-
-def prepare(structure1, c1, structure2, c2):
+    if grid is None:
+        footprints = [p.footprint() for p in level]
+
+        def occupied(*area):
+            area = footprint.box(*area)
+            return any(footprint.overlap(area, other) for other in footprints)
+
+        candidates = [(index, sub_id) for index, p in enumerate(level) for sub_id in p.open_connectors()]
+    else:
+        occupied = grid.any_occupied
+        candidates = set(grid.unchecked)
+        new = level[-1].footprint()
+        if new.col_min <= new.col_max:
+            candidates.update(grid.connectors_in(new.row_min - 1, new.row_max + 1, new.col_min - 1, new.col_max + 1))
+        candidates = sorted(candidates)
+
+    for index, sub_id in candidates:
+        p = level[index]
+        if not p.is_open(sub_id):
+            continue
+        if grid is not None:
+            grid.unchecked.discard((index, sub_id))
+
+        r, c, direction = p.connector(sub_id)
+        r_min, r_max, c_min, c_max = clearance[direction]
+        # we check if there are tiles in the adjacent positions
+        if occupied(r + r_min, r + r_max, c + c_min, c + c_max):
+            logger.info("disabling connector at (%s,%s)", r, c)
+            if owned is not None and index not in owned:
+                level[index] = p = p.copy()
+                owned.add(index)
+            p.disabled.add(sub_id)
+            if frontier is not None:
+                frontier.close(index, sub_id)
+
+
+def substitution(placement1, c1_sub_id, structure2, c2_sub_id):
+    """
+    Offset that connects connector c2_sub_id of structure2 to connector
+    c1_sub_id of placement1 and, when known, the footprint of structure2
+    there. Pairs found by compute_combinations are looked up in its table
+    """
+    dr1, dc1 = placement1.offset
+    entry = placement1.template.placements[c1_sub_id].get((structure2.id, c2_sub_id))
+    if entry is None:
+        entry = structure_matching.substitution(placement1.template, c1_sub_id, structure2, c2_sub_id)
+    (dr, dc), moved = entry
+    # the table footprint is clipped for a placement1 at row 0 only
+    return (dr1 + dr, dc1 + dc), footprint.translate(moved, 0, dc1) if dr1 == 0 else None
+
+
+def placement_context(grid, structure2, c2_sub_id, offset):
+    """
+    Local context of placing structure2 at offset (see NogoodCache): the
+    placement itself plus, for each connector it would open, whether its
+    clearance box already holds a tile. The column of the offset only
+    matters when the placement reaches past column 0, otherwise the same
+    placement further right opens the same substitutions.
+    """
+    dr, dc = offset
+    cols = structure2.cols.tolist() + structure2.conn_cols
+    key = (dr, dc if cols and dc + min(cols) < 0 else None)
+    occupied = []
+    for sub_id in range(structure2.sub_id):
+        r, c = structure2.conn_rows[sub_id] + dr, structure2.conn_cols[sub_id] + dc
+        if sub_id == c2_sub_id or not structure2.enabled[sub_id] or r < 0 or r > 15 or c < 0:
+            continue
+        r_min, r_max, c_min, c_max = clearance[structure2.conn_dirs[sub_id]]
+        occupied.append(grid.any_occupied(r + r_min, r + r_max, c + c_min, c + c_max))
+    return structure2.id, c2_sub_id, key, tuple(occupied)
+
+
+def prepare(level, index1, c1_sub_id, structure2, c2_sub_id, frontier=None, grid=None, scorer=None):
     """
-    Prepare structure2 to to be connected with structure1
-    1 - Adjust coordinates of all nodes
+    Place structure2 in the level, connected to placement index1
+    1 - Compute the offset of structure2
     2 - Set conectors as combined
-    3 - Remove combinables from list of connectors
-    4 - Remove nodes outside of screen bounds
+    3 - Mark the candidate as tried on the first connector
+    4 - Move the open connectors into the frontier and write the cells into
+        the occupancy grid and density scorer, if given
+    Nodes outside of screen bounds are left out by the placement itself.
   """
-    horizontal = {"r": -1, "l": 1, "u": 0, "d": 0}
-    vertical = {"r": 0, "l": 0, "u": -1, "d": 1}
-
-    adjust_column = (c1.c + (horizontal[c1.direction])) - c2.c
-    adjust_row = (c1.r + (vertical[c2.direction])) - c2.r
-
-    c1.combined = [structure2, c2]
-    c2.combined = [structure1, c1]
-
-    c1.combinable.remove((structure2.id, c2.sub_id))
-    c2.combinable.remove((structure1.id, c1.sub_id))
-
-    for n in structure2.nodes + structure2.connecting:
-        n.c += adjust_column
-        n.r += adjust_row
-
-    for n in reversed(structure2.nodes + structure2.connecting):
-        if n.r < 0 or n.r > 15 or n.c < 0:
-            try:
-                structure2.nodes.remove(n)
-            except:
-                structure2.connecting.remove(n)
-    return structure2
-
-
-def has_collision(structures, ignore_air=True):
-    """Given a list of structures, any tiles collide"""
-    level_matrix = {}
-    for str in structures:
-        for n in str.nodes:
-            if (n.r, n.c) not in level_matrix.keys():
-                level_matrix[(n.r, n.c)] = n.tile
-            else:
-                if (not ignore_air) and (n.tile == "-"
-                                         or level_matrix[(n.r, n.c)] == "-"):
-                    return True
-    return False
+    placement1 = level[index1]
+    placement2 = Placement(structure2, *substitution(placement1, c1_sub_id, structure2, c2_sub_id))
+    placement1.combined[c1_sub_id] = (len(level), c2_sub_id)
+    placement2.combined[c2_sub_id] = (index1, c1_sub_id)
+    placement1.tried.setdefault(c1_sub_id, set()).add((structure2.id, c2_sub_id))
+
+    level.append(placement2)
+    if frontier is not None:
+        frontier.close(index1, c1_sub_id)
+        frontier.open_placement(level, len(level) - 1)
+    if grid is not None:
+        grid.push(placement2, len(level) - 1)
+    if scorer is not None:
+        scorer.push(placement2)
+    return placement2
+
+
+def has_collision(level, ignore_air=True, grid=None):
+    """
+    Given a list of placements, check if any tiles collide. Only overlaps
+    where either tile is air count, so with ignore_air nothing collides.
+    With an occupancy grid only the newest placement is checked, as the
+    level was collision free before it.
+    """
+    if ignore_air:
+        return False
+    if grid is not None:
+        return grid.collides(ignore_air)
 
+    # every placement is compared to the first tile written in each cell
+    board = Bitboard()
+    return any(board.push(p.footprint()).any() for p in level)
 
-def available_substitutions(structures):
+
+def available_substitutions(level):
+    """List every (placement index, sub_id, structure id, sub_id) that can still be tried"""
     available = []
-    for str in structures:
-        available.extend(str.available_substitutions())
+    for index, p in enumerate(level):
+        for sub_id in p.open_connectors():
+            for s_id, n2 in p.combinable(sub_id):
+                available.append((index, sub_id, s_id, n2))
 
     return available
 
 
+def add_events(events, **counts):
+    """Add counts to an events dict, nothing happens when events is None"""
+    if events is not None:
+        for name, count in counts.items():
+            events[name] = events.get(name, 0) + count
+
+
 def list_to_dict(structures, g_s, g_f):
     dict_structures = {}
     for s in structures + [g_s, g_f]:
@@ -130,147 +216,247 @@ def list_to_dict(structures, g_s, g_f):
     return dict_structures
 
 
-def greed_search(g_s, g_f, structures):
-    logger.info("starting BFS")
-    original_structures = list_to_dict(structures, g_s, g_f)
-
-    queue = [(get_density_score([g_s]), [g_s])]
-
-    while len(queue) > 0:
-        density, current = queue.pop(0)
-
-        if len(current) == 30:
-            logger.info("Finished generation")
-            logger.info("Level: \n{}".format(print_level(current)))
-            generated_structure = Structure(-1)
-            # print("Length: {}".format(len(level)))
-            for s in current:
-                generated_structure.nodes.extend(s.nodes)
-            return generated_structure, len(current)
-            # sys.exit()
-
-        substitutions = available_substitutions(current)
-
-        for i in range(len(substitutions)):
-            level = copy.deepcopy(current)
-            str1, c1, str2_id, c2_sub_id = available_substitutions(level)[i]
-
-            if str2_id == g_s.id or str2_id == g_f.id:
-                continue
-
-            str2 = copy.deepcopy(original_structures[str2_id])
-            c2 = str2.get_connector(c2_sub_id)
-
-            str2 = prepare(str1, c1, str2, c2)
-            level.append(str2)
-
-            check_connectors(level)
-            collides = has_collision(level)
-            substitutions = available_substitutions(level)
-
-            if len(substitutions) <= 0 or collides:
-                continue
+def expand(current, structures, terminal_ids=()):
+    """
+    Lazily yield every level that extends current by one structure and can
+    still grow. Children share the placements they don't change with
+    current, so only the touched ones are copied.
+    """
+    for index1, c1_sub_id, str2_id, c2_sub_id in available_substitutions(current):
+        if str2_id in terminal_ids:
+            continue
 
-            logger.info("saving expansion {}".format(i))
+        level = list(current)
+        level[index1] = current[index1].copy()
+        owned = {index1, len(level)}
+        prepare(level, index1, c1_sub_id, structures[str2_id], c2_sub_id)
 
-            queue.append((get_density_score(level), level))
+        check_connectors(level, owned=owned)
+        if has_collision(level) or len(available_substitutions(level)) <= 0:
+            continue
+        yield level
 
-        queue.sort(key=lambda x: x[0])
-        logger.info("Sorted queue:")
-        for density, level in queue:
-            logger.info("Score {}".format(density))
-            logger.info("Level: \n{}".format(print_level(level)))
-        queue = queue[:1]
-    return None, -1
 
+def greed_search(g_s, g_f, structures, beam_width=1, target_length=30, score=DensityScorer.density_score,
+                 events=None, rng=None):
+    """
+    Beam search over whole levels. Every round expands the levels of the
+    beam and keeps the beam_width children with the lowest score, ties going
+    to the child generated first, or drawn from rng (a random.Random) if
+    given, until a level holds target_length structures. With the defaults
+    this is the original greedy search.
+    score is called with the DensityScorer of a level, e.g.
+    DensityScorer.increasing_density_score.
+    Returns the same values as generate_level, and adds the number of
+    levels expanded and children scored to the events dict, if given.
+    """
+    logger.info("starting beam search, width %s, target length %s", beam_width, target_length)
+    original_structures = list_to_dict(structures, g_s, g_f)
+    terminal_ids = (g_s.id, g_f.id)
+    usage_stats = dict.fromkeys(original_structures.keys(), 0)
 
-def generate_level(structures, g_s, g_f, minimum_count=10):
+    start = [Placement(g_s)]
+    scorer = DensityScorer()
+    scorer.push(start[0])
+    beam = [(score(scorer), 0, start, scorer)]
+    count_expansions = 0
+    count_children = 0
+
+    while len(beam) > 0:
+        for density, _, current, _ in beam:
+            if len(current) == target_length:
+                logger.info("Finished generation, score %s, %s levels expanded", density, count_expansions)
+                for p in current[1:]:
+                    usage_stats[p.id] += 1
+                generated_structure = combine([p.structure() for p in current])
+                add_events(events, expansions=count_expansions, children=count_children)
+                return generated_structure, usage_stats, count_expansions, 0, current, "finished"
+
+        # bounded max-heap of the best children: the root is the worst one kept
+        kept = []
+        order = 0
+        for _, _, current, scorer in beam:
+            count_expansions += 1
+            for level in expand(current, original_structures, terminal_ids):
+                order += 1
+                count_children += 1
+                # children are scored on the parent's scorer, which is only
+                # copied for the children that make it into the heap
+                scorer.push(level[-1])
+                key = (-score(scorer), -order if rng is None else rng.random())
+                if len(kept) < beam_width or key > kept[0][:2]:
+                    entry = key + (level, scorer.copy())
+                    if len(kept) < beam_width:
+                        heapq.heappush(kept, entry)
+                    else:
+                        heapq.heapreplace(kept, entry)
+                scorer.pop()
+
+        beam = sorted((-density, -order, level, scorer) for density, order, level, scorer in kept)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Beam scores: %s", [density for density, _, _, _ in beam])
+        if beam:
+            debug_level("Best level: \n%s", beam[0][2])
+
+    add_events(events, expansions=count_expansions, children=count_children)
+    raise EnvironmentError("beam search ran out of levels to expand")
+
+
+def generate_level(structures, g_s, g_f, minimum_count=10, rng=random, time_budget=None, step_budget=None,
+                   nogoods=None, events=None):
+    """
+    Grow a level from g_s by randomly substituting open connectors, drawing
+    from rng (a random.Random, the global random state by default), and
+    backtracking when a placement leaves nothing to substitute.
+
+    Generation stops once the level holds minimum_count structures, after
+    500 backtracks, or when the time budget (seconds) or the step budget
+    (substitutions tried) runs out. Unless the level was finished, the
+    longest level seen along the way is returned. When a budget ran out
+    before that level held half of minimum_count structures, generation
+    failed: the level returned is None and no structures were used. The
+    last value returned tells why generation stopped: "finished",
+    "backtracks", "time", "steps" or "exhausted".
+
+    nogoods (a NogoodCache, a fresh one by default) remembers what each
+    placement opened in its context, so substitutions known to fail are
+    skipped without building them. Pass the same cache to several calls
+    with the same structures to share what was learned.
+
+    events, if given, is a dict the counts of what happened are added to:
+    placements tried, substitutions pruned, nogood cache hits and misses,
+    collisions, placements leaving no substitutions, backtracks and
+    placement copies.
+    """
     original_structures = list_to_dict(structures, g_s, g_f)
     usage_stats = dict.fromkeys(original_structures.keys(), 0)
 
     count_substitutions = 0
     count_backtrack = 0
+    count_steps = 0
+    count_tried = 0
+    count_pruned = 0
+    count_collisions = 0
+    count_dead_ends = 0
+    count_backtracks = 0  # every backtrack, count_backtrack only has the ones of an empty frontier
+    count_copies = 0
     highest_col = 0
+    max_col = None
     finished = False
+    stop_reason = "exhausted"
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
 
     logger.info("Generating level...")
-    level = [copy.deepcopy(g_s)]  # the generating level is a list of structures
-    logger.info("Initial structure generated!\n{}".format(print_level(level)))
-
-    substitutions = available_substitutions(level)
+    level = [Placement(g_s)]  # the generating level is a list of placements
+    logger.info("Initial structure generated!")
+    debug_level("\n%s", level)
+
+    frontier = Frontier((g_s.id, g_f.id))
+    frontier.open_placement(level, 0)
+    grid = OccupancyGrid()
+    grid.push(level[0], 0)
+    scorer = DensityScorer()
+    scorer.push(level[0])
+    best = list(level)  # longest level seen so far
+    if nogoods is None:
+        nogoods = NogoodCache()
+    hits, misses = nogoods.hits, nogoods.misses  # the cache may be shared with earlier levels
 
     logger.info("Starting substitution process...")
-    logger.info("Available subsistutions: {}".format(len(substitutions)))
+    logger.info("Available subsistutions: %s", len(frontier))
 
-    while len(substitutions) > 0:
+    while len(frontier) > 0:
 
         while True:
-            # logger.info("All Available substitutions.txt: ")
-            # for str1, c1, str2_id, c2_id in substitutions.txt:
-            #   logger.info("Structure {}, connector {}, to Structure {} via connector {}".format(str1.id, c1, str2_id, c2_id))
-            while len(substitutions) == 0:
+            if deadline is not None and time.perf_counter() > deadline:
+                stop_reason = "time"
+                break
+            if step_budget is not None and count_steps >= step_budget:
+                stop_reason = "steps"
+                break
+            count_steps += 1
+
+            while frontier.n_usable() == 0:
                 try:
-                    level = backtrack(level)
+                    level = backtrack(level, frontier, grid, scorer)
                 except IndexError:
                     print("pop from empty list when substitutions.txt == 0")
                     logger.critical(f"pop from empty structure list, {usage_stats}, {count_substitutions}, {count_backtrack}")
                     raise EnvironmentError("first structure doesnt have connections")
 
-                substitutions = available_substitutions(level)
                 count_backtrack += 1
+                count_backtracks += 1
                 # print(f"backtrackig {count_backtrack}")
 
-            str1, c1, str2_id, c2_sub_id = random.choice(substitutions)
-            substitutions.remove((str1, c1, str2_id, c2_sub_id))
-
-            if str2_id == g_s.id or str2_id == g_f.id:
+            index1, c1_sub_id, str2_id, c2_sub_id = frontier.sample(rng)
+            frontier.discard((index1, c1_sub_id, str2_id, c2_sub_id))
+            str2 = original_structures[str2_id]
+
+            offset, _ = substitution(level[index1], c1_sub_id, str2, c2_sub_id)
+            context = placement_context(grid, str2, c2_sub_id, offset)
+            if nogoods.lookup(context) == 0 and frontier.only_connector(index1, c1_sub_id):
+                # the placement would open nothing and using c1 closes everything left, so it is bound to fail
+                logger.info("Skipping structure %s with connector %s, a known dead end", str2_id, c2_sub_id)
+                nogoods.pruned += 1
+                count_pruned += 1
+                level[index1].tried.setdefault(c1_sub_id, set()).add((str2_id, c2_sub_id))
+                frontier.close(index1, c1_sub_id)
+                frontier.open(level, index1, c1_sub_id)
                 continue
-            str2 = copy.deepcopy(original_structures[str2_id])
-            c2 = str2.get_connector(c2_sub_id)
 
-            logger.info("Trying to append structure {} using its connector {} via structure {} with connector {}".format(str2_id, c2, str1.id, c1))
-            logger.info("\n{}".format(str2.pretty_print()))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Trying to append structure %s using its connector %s via structure %s with connector %s",
+                            str2_id, str2.get_connector(c2_sub_id), level[index1].id, level[index1].connector(c1_sub_id))
+            logger.debug("\n%s", Lazy(str2.pretty_print))
 
-            str2 = prepare(str1, c1, str2, c2)
-            level.append(str2)
+            placement2 = prepare(level, index1, c1_sub_id, str2, c2_sub_id, frontier, grid, scorer)
+            count_tried += 1
 
-            check_connectors(level)
-            collides = has_collision(level, True)
-            substitutions = available_substitutions(level)
-            density = get_density_score(level, 2)
+            check_connectors(level, frontier, grid)
+            nogoods.record(context, sum(len(frontier.substitutions(len(level) - 1, sub_id) or ())
+                                        for sub_id in range(str2.sub_id)))
+            collides = has_collision(level, True, grid)
+            density = scorer.density_score(2)
 
-            if len(substitutions) <= 0 or collides:
-                if len(substitutions) <= 0:
+            if len(frontier) <= 0 or collides:
+                if len(frontier) <= 0:
                     logger.info("Simulated structure has no available substitutions.txt, trying next...")
+                    count_dead_ends += 1
                 if collides:
                     logger.info("Collision Happened!")
-                c1.combined = None  # reset state of first connector
+                    count_collisions += 1
+                reopen(level, index1, c1_sub_id, frontier)  # reset state of first connector
 
                 try:
-                    level = backtrack(level)
+                    level = backtrack(level, frontier, grid, scorer)
+                    count_backtracks += 1
                 except IndexError:
                     print("pop from empty list when substitutions.txt <= 0 or collides")
                     logger.critical("pop from empty structure list")
                     break
-                substitutions = available_substitutions(level)
                 # input("Press Enter to continue...")
             else:
                 # logger.info("Sucessfull substitution")
                 # input("Press Enter to continue...")
                 usage_stats[str2_id] += 1
-                for n in str2.nodes:
-                    if n.c > highest_col:
-                        highest_col = n.c
+                highest_col = max(highest_col, int(placement2.cells()[1].max(initial=0)))
+                if len(level) > len(best):
+                    best = [p.copy() for p in level]
+                    count_copies += len(level)
                 break
 
+        if stop_reason in ("time", "steps"):
+            break
+
         count_substitutions += 1
         if count_backtrack > 500:
             print("count_backtrack > 500, breaking")
+            stop_reason = "backtracks"
             break
 
-        logger.info("Available substitutions.txt: {}".format(len(substitutions)))
-        logger.info("Substitutions applied so far: {}".format(count_substitutions))
-        logger.info("\n{}".format(print_level(level)))
+        logger.info("Available substitutions.txt: %s", len(frontier))
+        logger.info("Substitutions applied so far: %s", count_substitutions)
+        debug_level("\n%s", level)
 
         # if highest_col >= 202:
         if len(level) == minimum_count:
@@ -290,22 +476,32 @@ def generate_level(structures, g_s, g_f, minimum_count=10):
             #     break
             #
             # OPTION 2: simply cut off the level at 202
-            for struct in level:
-                for n in reversed(struct.nodes):
-                    if n.c > 201:
-                        struct.nodes.remove(n)
+            max_col = 201
             finished = True
+            stop_reason = "finished"
             break
 
         if finished:
             break
 
-    generated_structure = Structure(-1)
+    if not finished and len(best) > len(level):
+        logger.info("Returning the longest level seen (%s structures) instead of the last one (%s)",
+                    len(best), len(level))
+        level = best
+    logger.info("Generation stopped: %s", stop_reason)
+    add_events(events, placements_tried=count_tried, pruned=count_pruned, collisions=count_collisions,
+               dead_ends=count_dead_ends, backtracks=count_backtracks, copies=count_copies,
+               nogood_hits=nogoods.hits - hits, nogood_misses=nogoods.misses - misses)
+    logger.info("Nogood cache: %s", nogoods.summary())
+
+    if stop_reason in ("time", "steps") and len(level) < minimum_count // 2:
+        logger.info("Only %s structures when the %s budget ran out, no level", len(level), stop_reason)
+        return None, usage_stats, count_substitutions, count_backtrack, [], stop_reason
+
     # print("Length: {}".format(len(level)))
     print(f"Level generated, containing structures:\n{level}")
-    for s in level:
-        generated_structure.nodes.extend(s.nodes)
-    return generated_structure, usage_stats, count_substitutions, count_backtrack, level
+    generated_structure = combine([p.structure(max_col) for p in level])
+    return generated_structure, usage_stats, count_substitutions, count_backtrack, level, stop_reason
 
 
 def instantiate_base_level(id_structures):
@@ -0,0 +1,40 @@
+class NogoodCache:
+    """
+    Remembers how many substitutions a placement opened in a given local
+    context, so substitutions known to be dead ends can be skipped.
+
+    A context is the structure and connector that were placed, the offset
+    they were placed at and which clearance boxes of the new connectors
+    were already occupied by the level. Those fully decide what the new
+    placement adds to the frontier, so the cache never needs invalidating
+    for the same structure library.
+    """
+
+    def __init__(self):
+        self.table = {}  # context -> substitutions opened by the placement
+        self.hits = 0
+        self.misses = 0
+        self.pruned = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def lookup(self, context):
+        """Return the substitutions the placement opened in this context, None if unknown"""
+        opened = self.table.get(context)
+        if opened is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return opened
+
+    def record(self, context, opened):
+        self.table[context] = opened
+
+    def clear(self):
+        """Forget every context, e.g. to free memory, the counts are kept"""
+        self.table.clear()
+
+    def summary(self):
+        return "{} hits, {} misses, {} substitutions pruned, {} contexts".format(
+            self.hits, self.misses, self.pruned, len(self.table))
@@ -0,0 +1,59 @@
+from .bitboard import Bitboard
+
+
+class OccupancyGrid:
+    """The occupied cells and the connectors, indexed by column, of a level that is being generated"""
+
+    def __init__(self, n_cols=64):
+        self.board = Bitboard(n_cols)
+        self.columns = {}  # column -> {(placement index, sub_id): row}
+        self.unchecked = set()  # connectors not verified against the grid yet
+        self._log = []
+
+    def __len__(self):
+        return len(self._log)
+
+    def push(self, placement, index):
+        """Write the cells and open connectors of the placement at position index of the level"""
+        collided = bool(self.board.push(placement.footprint()).any())
+
+        connectors = []
+        for sub_id in placement.open_connectors():
+            r, c, _ = placement.connector(sub_id)
+            self.columns.setdefault(c, {})[(index, sub_id)] = r
+            self.unchecked.add((index, sub_id))
+            connectors.append((c, (index, sub_id)))
+        self._log.append((collided, connectors))
+
+    def pop(self):
+        """Undo the latest push"""
+        self.board.pop()
+        _, connectors = self._log.pop()
+        for c, key in connectors:
+            column = self.columns[c]
+            del column[key]
+            if not column:
+                del self.columns[c]
+            self.unchecked.discard(key)
+
+    def any_occupied(self, row_min, row_max, col_min, col_max):
+        """Check whether any cell of the rectangle is covered"""
+        return self.board.any_filled(row_min, row_max, col_min, col_max)
+
+    def connectors_in(self, row_min, row_max, col_min, col_max):
+        """List the (placement index, sub_id) of the connectors inside the rectangle"""
+        found = []
+        for c in range(col_min, col_max + 1):
+            for key, r in self.columns.get(c, {}).items():
+                if row_min <= r <= row_max:
+                    found.append(key)
+        return found
+
+    def collides(self, ignore_air=True):
+        """
+        Check whether the latest placement overlaps an earlier one where either
+        tile is air, comparing against the first tile written in the cell
+        """
+        if ignore_air or not self._log:
+            return False
+        return self._log[-1][0]
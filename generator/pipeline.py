@@ -0,0 +1,179 @@
+"""
+Streaming level generation.
+
+generate_levels yields each level as soon as it is generated, in order and
+together with the stats of its generation (see generate_one), by this
+process or by a pool of worker processes. A Pipeline hands those levels to
+consumer stages (saving, metrics, rendering...) running on a thread pool
+behind a bounded queue. The generator only hands levels off and moves on,
+and blocks while the queue is full, so a long run never holds more than a
+few levels in memory.
+"""
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import level_generation
+from .scoring import DensityScorer
+
+logger = logging.getLogger(__name__)
+
+# placements is the level as the search built it, memory what helper.memory.measure reported for it
+GeneratedLevel = namedtuple("GeneratedLevel", ["n", "level", "stats", "substitutions", "backtracks",
+                                               "used_structures", "stop_reason", "time", "events", "placements",
+                                               "memory"],
+                            defaults=(None, None))
+
+
+def generate_one(n, structures, g_s, g_f, rng=random, search="random", minimum_count=10, beam_width=1,
+                 score=DensityScorer.density_score, time_budget=None, step_budget=None, nogoods=None):
+    """
+    Generate level n with the random (backtracking) or beam search, both
+    drawing from rng. The budgets and the nogood cache only apply to the
+    random search, budgets given with the beam search raise a ValueError.
+    Returns a GeneratedLevel, None if generation failed, e.g. when a
+    budget ran out on a level much too short. Its events are
+    the counts reported by the search (see generate_level)
+    """
+    logger.info("Generating level %s", n)
+    print(f"Generating level {n}")
+
+    if search == "beam" and (time_budget is not None or step_budget is not None):
+        raise ValueError("the beam search has no time or step budget")
+
+    events = {}
+    start_time = time.time()
+    try:
+        if search == "beam":
+            level, stats, substitutions, backtracks, used, stop_reason = level_generation.greed_search(
+                g_s, g_f, structures, beam_width, minimum_count, score, events, rng)
+        else:
+            level, stats, substitutions, backtracks, used, stop_reason = level_generation.generate_level(
+                structures, g_s, g_f, minimum_count, rng, time_budget, step_budget, nogoods, events)
+    except EnvironmentError:
+        print("Environmet Error!")
+        return None
+    if level is None:
+        logger.info("Level %s failed, generation stopped: %s", n, stop_reason)
+        return None
+
+    return GeneratedLevel(n, level, stats, substitutions, backtracks, [p.id for p in used], stop_reason,
+                          time.time() - start_time, events, used)
+
+
+def generate_levels(generate, count, workers=1, initializer=None, initargs=(), proceed=None):
+    """
+    Yield the GeneratedLevel of generate(n) for n in range(count), in
+    order, skipping the levels that failed. proceed(n), if given, is called
+    before each level and generation stops when it returns False.
+
+    With more than one worker, generate runs in a pool of processes, each
+    started with initializer(*initargs), so generate and its arguments must
+    be picklable. At most two levels per worker are in flight so finished
+    levels don't pile up.
+    """
+    if workers <= 1:
+        for n in range(count):
+            if proceed is not None and not proceed(n):
+                return
+            generated = generate(n)
+            if generated is not None:
+                yield generated
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        pending = deque()
+        for n in range(count):
+            if proceed is not None and not proceed(n):
+                break
+            pending.append(executor.submit(generate, n))
+            if len(pending) >= 2 * workers:
+                generated = pending.popleft().result()
+                if generated is not None:
+                    yield generated
+        while pending:
+            generated = pending.popleft().result()
+            if generated is not None:
+                yield generated
+
+
+# put on the queue to stop the consumer thread
+_DONE = object()
+
+
+def _run_stages(stages, item):
+    return [stage(item) for stage in stages]
+
+
+class Pipeline:
+    """
+    Consumer stages fed through a bounded queue.
+
+    Every item put is passed to each of stages in turn by a pool of workers
+    threads, so several items are processed at once. The ordered stages are
+    then called with the item and the list of what stages returned for it,
+    by a single background thread and in the order the items were put, e.g.
+    to write rows of a file. put blocks while maxsize items are waiting. If
+    a stage raises, the remaining items are dropped and the error is raised
+    again by the next put or by close.
+    """
+
+    def __init__(self, stages, maxsize=4, workers=1, ordered=()):
+        self.stages = list(stages)
+        self.ordered = list(ordered)
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stage")
+        self._thread = threading.Thread(target=self._drain, name="pipeline", daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        while True:
+            item, task = self.queue.get()
+            if item is _DONE:
+                return
+            if self.error is not None:
+                task.cancel()
+                continue
+            try:
+                results = task.result()
+                for stage in self.ordered:
+                    stage(item, results)
+            except Exception as e:
+                logger.exception("Pipeline stage failed")
+                self.error = e
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((item, self._executor.submit(_run_stages, self.stages, item)))
+
+    def run(self, items):
+        """Put every item of an iterable, e.g. a generator of levels"""
+        for item in items:
+            self.put(item)
+
+    def _stop(self):
+        self.queue.put((_DONE, None))
+        self._thread.join()
+        self._executor.shutdown()
+
+    def close(self):
+        """Wait for the queued items to go through every stage"""
+        self._stop()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # let the stages finish what is queued, the original error wins
+            self._stop()
@@ -0,0 +1,92 @@
+from . import footprint as fp
+
+
+class Placement:
+    """
+    A library structure placed in a level that is being generated.
+
+    Templates are never modified during generation. A placement only records
+    which template it uses, the (dr, dc) offset it sits at and the state of
+    its connectors:
+    - combined: sub_id -> (index of the other placement, its sub_id)
+    - tried: sub_id -> set of (structure id, sub_id) already attempted
+    - disabled: sub_ids that are outside of the level or lack clearance
+    so creating and discarding one is cheap.
+    """
+    __slots__ = ("template", "offset", "combined", "tried", "disabled", "_cells", "_footprint")
+
+    def __init__(self, template, offset=(0, 0), footprint=None):
+        self.template = template
+        self.offset = offset
+        self.combined = {}
+        self.tried = {}
+        self.disabled = set()
+        self._cells = None
+        self._footprint = footprint  # computed from the template when not given
+
+        dr, dc = offset
+        for i in range(template.sub_id):
+            r, c = template.conn_rows[i] + dr, template.conn_cols[i] + dc
+            if not template.enabled[i] or r < 0 or r > 15 or c < 0:
+                self.disabled.add(i)
+
+    @property
+    def id(self):
+        return self.template.id
+
+    def __repr__(self):
+        return f"StructureID: {self.id}"
+
+    def copy(self):
+        """Return an independent copy of the connector state"""
+        other = Placement.__new__(Placement)
+        other.template = self.template
+        other.offset = self.offset
+        other.combined = dict(self.combined)
+        other.tried = {sub_id: set(tried) for sub_id, tried in self.tried.items()}
+        other.disabled = set(self.disabled)
+        other._cells = self._cells
+        other._footprint = self._footprint
+        return other
+
+    def cells(self):
+        """Return the rows, columns and tile codes of the nodes that fall inside the level"""
+        if self._cells is None:
+            rows, cols = self.template.positions()
+            rows += self.offset[0]
+            cols += self.offset[1]
+            inside = (rows >= 0) & (rows <= 15) & (cols >= 0)
+            self._cells = rows[inside], cols[inside], self.template.codes[inside]
+        return self._cells
+
+    def footprint(self):
+        """Return the bounding box and column occupancy masks of cells()"""
+        if self._footprint is None:
+            self._footprint = fp.translate(self.template.footprint(), *self.offset)
+        return self._footprint
+
+    def connector(self, sub_id):
+        """Return the level position and direction of a connector"""
+        t = self.template
+        return t.conn_rows[sub_id] + self.offset[0], t.conn_cols[sub_id] + self.offset[1], t.conn_dirs[sub_id]
+
+    def is_open(self, sub_id):
+        return sub_id not in self.combined and sub_id not in self.disabled
+
+    def open_connectors(self):
+        return [i for i in range(self.template.sub_id) if self.is_open(i)]
+
+    def combinable(self, sub_id):
+        """Candidates of a connector that have not been attempted yet"""
+        tried = self.tried.get(sub_id)
+        if not tried:
+            return self.template.combinable[sub_id]
+        return [candidate for candidate in self.template.combinable[sub_id] if candidate not in tried]
+
+    def structure(self, max_col=None):
+        """Build a standalone Structure of the placement, e.g. for output"""
+        s = self.template.translated(*self.offset)
+        s.enabled = [i not in self.disabled for i in range(s.sub_id)]
+        s.combined = [self.combined.get(i) for i in range(s.sub_id)]
+        s.clip(max_col)
+        return s
@@ -4,16 +4,12 @@ import numpy as np
 
 
 def get_non_air(map_data, np_array=True):
-    non_air = np.empty((0, 2), int) if np_array else []
+    # argwhere over the column-major view keeps the column-by-column order
+    non_air = np.argwhere(map_data.columns != ord("-"))[:, ::-1].astype(int)
 
-    for column_id in range(map_data.n_cols):
-        for row_id in range(map_data.n_rows):
-            if map_data.get(row_id, column_id) != "-":
-                if np_array:
-                    non_air = np.append(non_air, np.array([[row_id, column_id]]), axis=0)
-                else:
-                    non_air.append((row_id, column_id))
-    return non_air
+    if np_array:
+        return non_air
+    return [tuple(p) for p in non_air.tolist()]
 
 
 def evenly_spaced_selection(map_data, N=3):
@@ -32,9 +28,15 @@ def evenly_spaced_selection(map_data, N=3):
     return selected_points
 
 
-def spaced_selection(map_data, N=3, D=3):
-    r = random.randint(0, map_data.n_rows)
-    c = random.randint(0, map_data.n_cols)
+def spaced_selection(map_data, N=3, D=3, rng=random, np_rng=None):
+    """
+    Randomly select N non-air points at least D apart. rng and np_rng are
+    the random.Random and numpy Generator to draw from, the global random
+    states by default
+    """
+    np_rng = np.random if np_rng is None else np_rng
+    r = rng.randint(0, map_data.n_rows)
+    c = rng.randint(0, map_data.n_cols)
 
     # store tiles r, c indexes, and probabilities for each
     pop = get_non_air(map_data, np_array=False)
@@ -60,10 +62,8 @@ def spaced_selection(map_data, N=3, D=3):
 
     selected_points = []
 
-    import numpy as np
-
     while len(selected_points) < N and len(pop_d) > 0:
-        index = np.random.choice(len(pop_d), 1, p=pop_d)[0]
+        index = np_rng.choice(len(pop_d), 1, p=pop_d)[0]
         r, c = pop[index]
         # print("Updating R, C {},{}".format(r,c))
         update_chances(pop, pop_d, r, c, D)
@@ -2,6 +2,8 @@ import logging
 import math
 import operator
 
+from helper.log import Lazy
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,7 +26,7 @@ def compute_reachability(node1, node2):
         else:
             return False
 
-    logger.debug("Calculating Rectangle and Triangles from node {}...".format(node1))
+    logger.debug("Calculating Rectangle and Triangles from node %s...", node1)
     h_dist = 3
     v_dist = 4
 
@@ -33,8 +35,8 @@ def compute_reachability(node1, node2):
     rect_r_min = 0 if node1.r - v_dist < 0 else node1.r - v_dist
     rect_r_max = 15 if node1.r + v_dist > 15 else node1.r + v_dist
 
-    logger.debug("c_min: {}, c_max: {}".format(rect_c_min, rect_c_max))
-    logger.debug("r_min: {}, r_max: {}".format(rect_r_min, rect_r_max))
+    logger.debug("c_min: %s, c_max: %s", rect_c_min, rect_c_max)
+    logger.debug("r_min: %s, r_max: %s", rect_r_min, rect_r_max)
 
     t1_p1_c = rect_c_min
     t1_p1_r = rect_r_min
@@ -47,8 +49,7 @@ def compute_reachability(node1, node2):
     if t1_p3_c < 0: t1_p3_c = 0
     t1_p3_r = 15
 
-    logger.debug(
-        "t1 p1: ({},{}), p2: ({},{}), p3: ({},{}),".format(t1_p1_r, t1_p1_c, t1_p2_r, t1_p2_c, t1_p3_r, t1_p3_c))
+    logger.debug("t1 p1: (%s,%s), p2: (%s,%s), p3: (%s,%s),", t1_p1_r, t1_p1_c, t1_p2_r, t1_p2_c, t1_p3_r, t1_p3_c)
 
     t2_p1_c = rect_c_max
     t2_p1_r = rect_r_min
@@ -64,17 +65,16 @@ def compute_reachability(node1, node2):
     # angle = math.degrees(math.atan2(difference_x, difference_y))
     # logger.info("atan: {}".format(angle))
 
-    logger.info(
-        "t2 p1: ({},{}), p2: ({},{}), p3: ({},{}),".format(t2_p1_r, t2_p1_c, t2_p2_r, t2_p2_c, t2_p3_r, t2_p3_c))
+    logger.info("t2 p1: (%s,%s), p2: (%s,%s), p3: (%s,%s),", t2_p1_r, t2_p1_c, t2_p2_r, t2_p2_c, t2_p3_r, t2_p3_c)
 
     triang1 = inside_triangle(t1_p1_c, t1_p1_r, t1_p2_c, t1_p2_r, t1_p3_c, t1_p3_r, node2.c, node2.r)
-    logger.info("Checking if inside triangle 1: {}".format(triang1))
+    logger.info("Checking if inside triangle 1: %s", triang1)
 
     triang2 = inside_triangle(t2_p1_c, t2_p1_r, t2_p2_c, t2_p2_r, t2_p3_c, t2_p3_r, node2.c, node2.r)
-    logger.info("Checking if inside triangle 2: {}".format(triang2))
+    logger.info("Checking if inside triangle 2: %s", triang2)
 
     rect = inside_rectangle(rect_c_min, rect_c_max, rect_r_max, rect_r_min, node2.c, node2.r)
-    logger.info("Checking if inside rectangle: {}".format(rect))
+    logger.info("Checking if inside rectangle: %s", rect)
 
     return triang1 or triang2 or rect
 
@@ -102,8 +102,8 @@ def get_distances(s1, s2):
         elif node.type == "Non-Solid":
             s2_nonsolids.append(node)
 
-    logger.info("s1 solids: {}".format(s1_solids))
-    logger.info("s2 solids: {}".format(s2_solids))
+    logger.info("s1 solids: %s", s1_solids)
+    logger.info("s2 solids: %s", s2_solids)
 
     distances = []
     for n1 in s1_solids:
@@ -118,13 +118,13 @@ def get_distances(s1, s2):
 
 def is_reachable(structure1, structure2, dist=4.5):
     logger.info("Calculating Reachability...")
-    logger.info("S1: \n{}".format(structure1.pretty_print()))
-    logger.info("S2: \n{}".format(structure2.pretty_print()))
+    logger.debug("S1: \n%s", Lazy(structure1.pretty_print))
+    logger.debug("S2: \n%s", Lazy(structure2.pretty_print))
 
     distances = get_distances(structure1, structure2)
 
     for d, n1, n2 in distances:
-        logger.info("dist: {}, n1: {}, n2: {}".format(d, n1, n2))
+        logger.info("dist: %s, n1: %s, n2: %s", d, n1, n2)
 
         if compute_reachability(n1, n2):
             logger.info("Reachable!")
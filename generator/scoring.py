@@ -1,5 +1,6 @@
 import logging
-from .level import Level
+import numpy as np
+from .level import Level, reserve
 from . import constants
 
 logger = logging.getLogger(__name__)
@@ -24,86 +25,176 @@ def get_intervals(number, inter, skip=0):
     return intervals
 
 
-def get_enemy_density(level, start_col=0, end_col=0):
-    end_col = level.n_cols if (end_col == 0) else end_col
-    enemies = 0
-    for c in range(start_col, end_col + 1):
-        for r in range(level.n_rows):
-            if level.get(r, c) in constants.enemy_tiles:
-                enemies += 1
-    return enemies
+def count_scenes(n_cols, l=14, skip=3):
+    """Number of intervals get_intervals(n_cols, l, skip) returns"""
+    covered = n_cols - skip
+    return -(-covered // l) if covered > 0 else 0
+
 
+def stack_levels(levels):
+    """
+    Return the tile codes of a Level or of a sequence of Levels as an
+    (n_levels, n_cols, 16) array, padding the narrower levels with air, and
+    the width of each level. Code arrays in that layout are passed through.
+    """
+    if isinstance(levels, Level):
+        levels = [levels]
+    if isinstance(levels, np.ndarray):
+        codes = levels if levels.ndim == 3 else levels[np.newaxis]
+        return codes, np.full(len(codes), codes.shape[1])
 
-def create_level(structures):
-    level = Level()
-    for structure in structures:
-        for node in structure.nodes:
-            level.set(node.r, node.c, node.tile)
-    return level
+    widths = np.array([level.n_cols for level in levels], dtype=np.intp)
+    codes = np.full((len(levels), widths.max(initial=0), 16), constants.AIR, dtype=np.uint8)
+    for i, level in enumerate(levels):
+        codes[i, :level.n_cols] = level.columns
+    return codes, widths
 
 
-def get_density_score(structures, d=3, l=14):
-    logger.info("Calculating density...")
-    level = create_level(structures)
+def _unstack(levels, values):
+    """Drop the level axis again when a single level was given"""
+    if isinstance(levels, Level) or (isinstance(levels, np.ndarray) and levels.ndim == 2):
+        values = values[0]
+        return values.item() if np.ndim(values) == 0 else values
+    return values
 
-    # get intervals representing scenes, eg. 3-17, 18-34n
-    intervals = get_intervals(level.n_cols, l, 3)
-    logger.debug("Number of columns: {}".format(level.n_cols))
-    logger.debug("Scenes in the level: \n{}".format(intervals))
 
-    enemy_denisities = []
-    for start_col, end_col in intervals:
-        enemy_denisities.append(get_enemy_density(level, start_col, end_col))
+def column_enemy_counts(levels):
+    """Enemies in each column of a Level, or (n_levels, n_cols) for a stack of levels"""
+    codes, _ = stack_levels(levels)
+    return _unstack(levels, constants.is_enemy[codes].sum(axis=-1))
 
-    logger.debug("Enemies on each interval: \n{}".format(enemy_denisities))
 
-    # different calculation
-    enemy_denisities = [(abs(density - d)) for density in enemy_denisities]
-    score = sum(enemy_denisities)
-    logger.debug("Score: {}".format(score))
+def _scene_counts(codes, widths, l, skip):
+    columns = constants.is_enemy[codes].sum(axis=-1)
+    starts = np.arange(skip, codes.shape[1], l)
+    if len(starts) > 0:
+        scenes = np.add.reduceat(columns, starts, axis=-1)
+    else:
+        scenes = np.zeros((len(codes), 0), dtype=np.intp)
+    n_scenes = np.array([count_scenes(width, l, skip) for width in widths], dtype=np.intp)
+    scenes[np.arange(scenes.shape[1]) >= n_scenes[:, np.newaxis]] = 0
+    return scenes, n_scenes
 
-#    logger.debug("Enemies found on each interval: \n{}".format(enemy_denisities))
 
-    return score
+def scene_enemy_counts(levels, l=14, skip=3):
+    """
+    Enemies in each scene of get_intervals(n_cols, l, skip), as an
+    (n_levels, n_scenes) array for a stack of levels. Scenes past the end of
+    a narrower level are 0. Also returns the number of scenes of each level.
+    """
+    scenes, n_scenes = _scene_counts(*stack_levels(levels), l, skip)
+    return _unstack(levels, scenes), _unstack(levels, n_scenes)
 
 
-def get_increasing_density_score(structures, d=2, l=14):
-    logger.debug("Calculating density...")
-    level = create_level(structures)
+def _density_scores(levels, targets, l):
+    """Sum of |enemies - target| over the scenes of each level, targets being a function of the scene index"""
+    scenes, n_scenes = _scene_counts(*stack_levels(levels), l, 3)
+    index = np.arange(scenes.shape[1])
+    scores = (np.abs(scenes - targets(index)) * (index < n_scenes[:, np.newaxis])).sum(axis=-1)
+    return _unstack(levels, scores)
 
-    # get intervals representing scenes, eg. 3-17, 18-34n
-    intervals = get_intervals(level.n_cols, l, 3)
-    logger.debug("Number of columns: {}".format(level.n_cols))
-    logger.debug("Scenes in the level: \n{}".format(intervals))
 
-    enemy_densities = []
-    for start_col, end_col in intervals:
-        enemy_densities.append(get_enemy_density(level, start_col, end_col))
+def density_scores(levels, d=3, l=14):
+    """Sum of |enemies - d| over the scenes of a Level, or of every level of a stack"""
+    return _density_scores(levels, lambda index: d, l)
 
-    logger.debug("Enemies on each interval: \n{}".format(enemy_densities))
 
-    # different calculation
-    enemy_densities = [(abs(density - (d * i))) for i, density in zip(range(len(enemy_densities)), enemy_densities)]
-    logger.debug("After processing: \n{}".format(enemy_densities))
-    score = sum(enemy_densities)
-    logger.debug("Score: {}".format(score))
+def increasing_density_scores(levels, d=2, l=14):
+    """Sum of |enemies - d * scene index| over the scenes of a Level, or of every level of a stack"""
+    return _density_scores(levels, lambda index: d * index, l)
 
-#    logger.debug("Enemies found on each interval: \n{}".format(enemy_densities))
 
-    return score
+def get_enemy_density(level, start_col=0, end_col=0):
+    end_col = level.n_cols if (end_col == 0) else end_col
+    return int(constants.is_enemy[level.columns[start_col:end_col + 1]].sum())
+
+
+class DensityScorer:
+    """The tiles of a level that is being generated and its enemies per column and per scene of get_intervals"""
+
+    def __init__(self, scene_length=14, skip=3, n_cols=64):
+        self.scene_length = scene_length
+        self.skip = skip
+        self.level = Level()  # tiles of the level, later placements overwrite earlier ones
+        self.enemies = np.zeros(n_cols, dtype=np.intp)
+        self.scenes = np.zeros(n_cols // scene_length + 1, dtype=np.intp)
+        self._log = []
+
+    @property
+    def n_cols(self):
+        return self.level.n_cols
+
+    def _add_to_scenes(self, start, counts):
+        """Add per-column enemy counts, starting at column start, to the scene totals"""
+        cols = np.arange(start, start + len(counts))
+        in_scene = cols >= self.skip
+        np.add.at(self.scenes, (cols[in_scene] - self.skip) // self.scene_length, counts[in_scene])
+
+    def push(self, placement):
+        rows, cols, codes = placement.cells()
+        if len(cols) == 0:
+            self._log.append((0, self.level.columns[:0].copy(), self.n_cols))
+            return
+        start, end = int(cols.min()), int(cols.max()) + 1
+        n_cols = self.n_cols
+        self.level.grow(end)
+        self.enemies = reserve(self.enemies, end)
+        self.scenes = reserve(self.scenes, end // self.scene_length + 1)
+        self._log.append((start, self.level.columns[start:end].copy(), n_cols))
+
+        old = self.enemies[start:end].copy()
+        self.level.set_many(rows, cols, codes)
+        self.enemies[start:end] = constants.is_enemy[self.level.columns[start:end]].sum(axis=1)
+        self._add_to_scenes(start, self.enemies[start:end] - old)
+
+    def pop(self):
+        """Undo the latest push"""
+        start, codes, n_cols = self._log.pop()
+        end = start + len(codes)
+        old = self.enemies[start:end].copy()
+        self.level.paste_grid(codes.T, start)
+        self.level.truncate(n_cols)
+        self.enemies[start:end] = constants.is_enemy[codes].sum(axis=1)
+        self._add_to_scenes(start, self.enemies[start:end] - old)
+
+    def copy(self):
+        """Return a scorer of the same level, without the undo log"""
+        other = DensityScorer.__new__(DensityScorer)
+        other.scene_length = self.scene_length
+        other.skip = self.skip
+        other.level = self.level.copy()
+        other.enemies = self.enemies.copy()
+        other.scenes = self.scenes.copy()
+        other._log = []
+        return other
+
+    def n_scenes(self):
+        return count_scenes(self.n_cols, self.scene_length, self.skip)
+
+    def scene_densities(self):
+        return self.scenes[:self.n_scenes()]
+
+    def density_score(self, d=3):
+        return int(np.abs(self.scene_densities() - d).sum())
+
+    def increasing_density_score(self, d=2):
+        densities = self.scene_densities()
+        return int(np.abs(densities - d * np.arange(len(densities))).sum())
+
+
+def _count(level, found):
+    """Count the tiles found in a structure, a Level or each level of a stack"""
+    if hasattr(level, "codes"):
+        return int(found(level.codes).sum())
+    found = found(stack_levels(level)[0])
+    return _unstack(level, found.reshape(len(found), -1).sum(axis=-1))
 
 
 def get_platforms_count(level):
-    platform_nodes = 0
-    for node in level.nodes:
-        if node.tile == "X":
-            platform_nodes += 1
-    return platform_nodes
+    """Number of 'X' tiles of a structure or Level, or of each level of a stack"""
+    return _count(level, lambda codes: codes == ord("X"))
 
 
 def get_enemies_count(level):
-    enemy_nodes = 0
-    for n in level.nodes:
-        if n.tile in constants.enemy_tiles:
-            enemy_nodes += 1
-    return enemy_nodes
+    """Number of enemy tiles of a structure or Level, or of each level of a stack"""
+    return _count(level, lambda codes: constants.is_enemy[codes])
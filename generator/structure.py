@@ -1,17 +1,27 @@
 # import substructure_manipulation
 import logging
 import copy
+import numpy as np
 from . import constants
-from .level import Level
+from . import tile_codec
+from . import footprint as fp
 
 logger = logging.getLogger(__name__)
 
 
 class Connector:
+    """
+    A connecting point of a structure. The connectors returned by
+    Structure.connecting and Structure.get_connector are views of the
+    structure's connector table, with positions in level coordinates.
+    """
+    __slots__ = ("r", "c", "direction", "sub_id", "combined", "combinable", "structure")
+
     def __init__(self, r, c, direction, structure=None):
         self.r = r
         self.c = c
         self.direction = direction
+        self.sub_id = None
         self.combined = None
         self.combinable = []
         self.structure = structure
@@ -21,60 +31,164 @@ class Connector:
 
 
 class Node:
+    """A single tile of a structure, as returned by Structure.nodes"""
+    __slots__ = ("r", "c", "tile", "type", "structure")
+
     def __init__(self, r, c, tile="-", type="Non-Solid", structure=None):
         self.r = r
         self.c = c
         self.tile = tile
         self.type = type
         self.structure = structure
-        self.edges = []
 
     def __repr__(self):
         return "Node({},{} {})".format(self.r, self.c, self.tile)
 
 
 class Structure:
+    """
+    A piece of level stored as a struct of arrays.
+
+    Nodes are kept as parallel arrays of rows, columns, tile codes and
+    solidity, and connectors as a small table of parallel lists indexed by
+    sub_id. Both are in the structure's own frame, and offset holds the
+    (dr, dc) translation that places the structure in the level, so moving
+    a structure never touches its nodes.
+    """
 
     def __init__(self, structure_id):
         self.id = structure_id
         self.sub_id = 0  # sub_id for connectors
-        self.nodes = []
-        self.connecting = []
+        self.offset = (0, 0)
+
+        # node table
+        self.rows = np.empty(0, dtype=np.int16)
+        self.cols = np.empty(0, dtype=np.int16)
+        self.codes = np.empty(0, dtype=np.uint8)
+        self.solid = np.empty(0, dtype=bool)
+
+        # connector table
+        self.conn_rows = []
+        self.conn_cols = []
+        self.conn_dirs = []
+        self.combinable = []
+        self.placements = []  # sub_id -> {(structure id, sub_id): Substitution}, see compute_combinations
+        self.combined = []
+        self.enabled = []
+
         self.enemies = 0
+        self._footprint = None  # footprint of the nodes in the structure's own frame
 
     def n_connecting(self):
-        return len(self.connecting)
+        return sum(self.enabled)
 
     def n_enemies(self):
         return self.enemies
 
+    def n_nodes(self):
+        return len(self.codes)
+
+    def add_nodes(self, rows, cols, tiles, solid):
+        """Append nodes given as parallel sequences in level coordinates"""
+        dr, dc = self.offset
+        codes = tile_codec.codes_of(tiles)
+        self.rows = np.concatenate((self.rows, np.asarray(rows, dtype=np.int16) - dr))
+        self.cols = np.concatenate((self.cols, np.asarray(cols, dtype=np.int16) - dc))
+        self.codes = np.concatenate((self.codes, codes))
+        self.solid = np.concatenate((self.solid, np.asarray(solid, dtype=bool)))
+        self.enemies += int(constants.is_enemy[codes].sum())
+        self._footprint = None
+
     def append_node(self, n):
-        self.nodes.append(n)
-        if n.tile in constants.enemy_tiles:
-            self.enemies += 1
+        self.add_nodes([n.r], [n.c], [n.tile], [n.type == "Solid"])
 
     def append_connector(self, c):
+        dr, dc = self.offset
         c.sub_id = self.sub_id
         self.sub_id += 1
-        self.connecting.append(c)
+        self.conn_rows.append(c.r - dr)
+        self.conn_cols.append(c.c - dc)
+        self.conn_dirs.append(c.direction)
+        self.combinable.append(c.combinable)
+        self.placements.append({})
+        self.combined.append(c.combined)
+        self.enabled.append(True)
+
+    def positions(self):
+        """Return the rows and columns of all nodes in level coordinates"""
+        dr, dc = self.offset
+        return self.rows.astype(np.intp) + dr, self.cols.astype(np.intp) + dc
+
+    def footprint(self):
+        """Return the bounding box and column occupancy masks of the nodes inside the level"""
+        if self._footprint is None:
+            self._footprint = fp.of_cells(self.rows, self.cols, self.codes)
+        return fp.translate(self._footprint, *self.offset)
+
+    @property
+    def nodes(self):
+        rows, cols = self.positions()
+        tiles = self.codes.tobytes().decode("ascii")
+        return [Node(r, c, tile, "Solid" if solid else "Non-Solid", self)
+                for r, c, tile, solid in zip(rows.tolist(), cols.tolist(), tiles, self.solid.tolist())]
+
+    def _connector_view(self, sub_id):
+        dr, dc = self.offset
+        c = Connector(self.conn_rows[sub_id] + dr, self.conn_cols[sub_id] + dc, self.conn_dirs[sub_id], self)
+        c.sub_id = sub_id
+        c.combinable = self.combinable[sub_id]
+        c.combined = self.combined[sub_id]
+        return c
+
+    @property
+    def connecting(self):
+        return [self._connector_view(i) for i in range(self.sub_id) if self.enabled[i]]
 
     def get_connector(self, sub_id):
-        logger.info("Trying to get sub_id: {}".format(sub_id))
-        for c in self.connecting:
-            logger.info("Checking: {}".format(c.sub_id))
-            if c.sub_id == sub_id:
-                return c
+        if 0 <= sub_id < self.sub_id and self.enabled[sub_id]:
+            return self._connector_view(sub_id)
+
+    def translate(self, dr, dc):
+        """Move the structure by (dr, dc) without touching its nodes"""
+        self.offset = (self.offset[0] + dr, self.offset[1] + dc)
+
+    def translated(self, dr, dc):
+        """Return a moved copy sharing the node and connector tables"""
+        moved = copy.copy(self)
+        moved.translate(dr, dc)
+        return moved
+
+    def clip(self, max_col=None):
+        """
+        Drop the nodes and disable the connectors that fall outside of the
+        16 level rows, left of column 0 or, if given, right of max_col
+        """
+        dr, dc = self.offset
+
+        rows, cols = self.positions()
+        inside = (rows >= 0) & (rows <= 15) & (cols >= 0)
+        if max_col is not None:
+            inside &= cols <= max_col
+        if not inside.all():
+            self.rows, self.cols = self.rows[inside], self.cols[inside]
+            self.codes, self.solid = self.codes[inside], self.solid[inside]
+            self._footprint = None
+
+        enabled = list(self.enabled)
+        for i in range(self.sub_id):
+            r, c = self.conn_rows[i] + dr, self.conn_cols[i] + dc
+            if r < 0 or r > 15 or c < 0 or (max_col is not None and c > max_col):
+                enabled[i] = False
+        self.enabled = enabled
 
     def relativize_coordinates(self):
         """Shift all nodes so the left-most node has column==0"""
-        if len(self.nodes) + len(self.connecting) < 1:
+        if len(self.cols) + self.sub_id < 1:
             return
-        smallest_c = (self.nodes + self.connecting)[0].c
-        for node in self.nodes + self.connecting:
-            if node.c < smallest_c:
-                smallest_c = node.c
-        for node in self.nodes + self.connecting:
-            node.c = node.c - smallest_c
+        smallest_c = min(self.cols.tolist() + self.conn_cols)
+        self.cols = self.cols - smallest_c
+        self.conn_cols = [c - smallest_c for c in self.conn_cols]
+        self._footprint = None
 
     def available_substitutions(self):
         substitutions = []
@@ -89,60 +203,47 @@ class Structure:
         # return "ID: {} \n Connecting Nodes: {} ".format(self.id, self.connecting)
         # return "ID: {}\n Nodes: {}\n Connecting Nodes: {}".format(self.id, self.nodes, self.connecting)
 
-    def matrix_representation(self):
-        generated = Level(" ")
-
-        for node in self.nodes:
-            generated.set(node.r, node.c, node.tile)
+    def tile_grid(self, filler=" ", connectors=True):
+        """Return the structure as a row-major grid of tile codes, drawing
+        connectors as arrows when requested"""
         directions = {"r": ">", "l": "<", "u": "^", "d": "v"}
-        for connector in self.connecting:
-            generated.set(connector.r, connector.c, directions[connector.direction])
+        rows, cols = self.positions()
+        codes = self.codes
+        if connectors:
+            connecting = self.connecting
+            rows = np.concatenate((rows, [c.r for c in connecting])).astype(np.intp)
+            cols = np.concatenate((cols, [c.c for c in connecting])).astype(np.intp)
+            codes = np.concatenate((codes, tile_codec.codes_of([directions[c.direction] for c in connecting])))
+        return tile_codec.from_nodes(rows, cols, codes, filler=filler)
 
-        return generated.matrix_representation()
+    def matrix_representation(self):
+        return tile_codec.to_matrix(self.tile_grid())
 
     def level_representation(self, filler=True):
-        # 1: find the highest column values
-        highest_column = 0
-        for node in self.nodes + self.connecting:
-            if node.c > highest_column:
-                highest_column = node.c
-
-        # 2: create a matrix with [16][n_columns]
-        base_tile = "-" if filler else " "
-        level = [[" " for i in range(highest_column + 1)] for j in range(16)]
-
-        # 3: fill the matrix with * where * is a
-        # placeholder image (maybe an empty 17x16 png)
-
-        # 4: iterate over all nodes and place tiles in
-        # the appropriate locations in the matrix
-        directions = {"r": ">", "l": "<", "u": "^", "d": "v"}
-        for node in self.nodes:
-            level[node.r][node.c] = node.tile
-        for node in self.connecting:
-            level[node.r][node.c] = directions[node.direction]
-
-        # 5: return the matrix, to be used in render_level
-        return level
+        return tile_codec.to_matrix(self.tile_grid())
 
     def pretty_print(self, filler=True):
-
-        level = self.level_representation(filler)
-        full_string = ""
-
-        for row in level:
-            row_str = ""
-            for tile in row:
-                row_str += tile
-            full_string += row_str + "\n"
-
-        return full_string
+        return tile_codec.encode(self.tile_grid())
 
     def save_as_level(self, level_filename="output.txt"):
-        generated = Level()
-
-        for n in self.nodes:
-            # print("Inserting node: {},{}".format(n.r, n.c))
-            generated.set(n.r, n.c, n.tile)
-
-        generated.save_level(level_filename)
+        tile_codec.write(self.tile_grid("-", connectors=False), level_filename)
+
+
+def combine(structures, structure_id=-1, connectors=False):
+    """
+    Merge the nodes of several structures, in order, into a new structure in
+    level coordinates. Open connectors are copied over when requested.
+    """
+    combined = Structure(structure_id)
+    positions = [s.positions() for s in structures]
+    combined.rows = np.concatenate([combined.rows] + [rows for rows, _ in positions]).astype(np.int16)
+    combined.cols = np.concatenate([combined.cols] + [cols for _, cols in positions]).astype(np.int16)
+    combined.codes = np.concatenate([combined.codes] + [s.codes for s in structures])
+    combined.solid = np.concatenate([combined.solid] + [s.solid for s in structures])
+    combined.enemies = int(constants.is_enemy[combined.codes].sum())
+
+    if connectors:
+        for s in structures:
+            for c in s.connecting:
+                combined.append_connector(Connector(c.r, c.c, c.direction))
+    return combined
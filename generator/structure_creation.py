@@ -1,38 +1,35 @@
 import logging
 from . import constants
-from .structure import Structure, Node, Connector
+from .structure import Structure, Connector
+from helper.log import Lazy
 
 logger = logging.getLogger(__name__)
 
 structure_id = 1
 
 
-def pretty_print_graph_map(graph_map, tiles=False):
+def graph_map_text(graph_map, tiles=False):
+    """Draw the graph map with the tile of each cell, or a letter per structure id"""
     import string
-    symbols = {0: "a", 1: "b", 2: "c", 3: "d", 4: "e", 5: "f", 6: "g", 7: "h"}
     size = len(string.ascii_lowercase)
 
-    if tiles:
-        row = "\n"
-        for g in graph_map:
-            for v in g:
-                if v is None:
-                    row += " "
-                else:
-                    row += "{}".format(v[0])
-            row += "\n"
-        logger.info(row)
-
-    else:
-        row = "\n"
-        for g in graph_map:
-            for v in g:
-                if v is None:
-                    row += " "
-                else:
-                    row += "{}".format(string.ascii_lowercase[v[1] % size])
-            row += "\n"
-        logger.info(row)
+    row = "\n"
+    for g in graph_map:
+        for v in g:
+            if v is None:
+                row += " "
+            elif tiles:
+                row += "{}".format(v[0])
+            else:
+                row += "{}".format(string.ascii_lowercase[v[1] % size])
+        row += "\n"
+    return row
+
+
+def pretty_print_graph_map(graph_map, tiles=False):
+    # only drawn when debug logging is on, from a copy as the map keeps being filled
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s", Lazy(graph_map_text, [column[:] for column in graph_map], tiles))
 
 
 def update_graph_map(map_data, graph_map, id, x_min, x_max, y_min, y_max):
@@ -43,7 +40,7 @@ def update_graph_map(map_data, graph_map, id, x_min, x_max, y_min, y_max):
         for y in range(y_min, y_max + 1):
             if graph_map[x][y] is not None and graph_map[x][y][1] != id:
                 # logger.info("Collision at x {}, y {}: {}".format(x,y, graph_map[x][y].structure.id))
-                logger.info("Collision at x {}, y {}: {}".format(x, y, graph_map[x][y][1]))
+                logger.info("Collision at x %s, y %s: %s", x, y, graph_map[x][y][1])
                 collisions.append([graph_map[x][y][1], x, y])
 
     if len(collisions) == 0:
@@ -82,7 +79,7 @@ def create(map_data, points, D=5):
         # initialize an empty list to save collisions of this cluster
         cluster_collisions[structure_id] = {}
         structures[structure_id] = Structure(structure_id)
-        logger.debug("Setting core point (id {}) x: {}, y: {}".format(structure_id, p[0], p[1]))
+        logger.debug("Setting core point (id %s) x: %s, y: %s", structure_id, p[0], p[1])
         clusters.append([structure_id, p[0], p[0], p[1], p[1], {"l": "d", "d": "r", "r": "u", "u": "l"}, "u", D])
         structure_id += 1
 
@@ -100,9 +97,8 @@ def create(map_data, points, D=5):
         if d > D * 4:
             continue
         move = moves[prev_move]
-        logger.info(
-            "id: {}, r_min: {}, r_max:{}, c_min:{}, c_max:{}, move: {}".format(id, r_min, r_max, c_min, c_max, move))
-        logger.info("Move list: {}".format(moves))
+        logger.info("id: %s, r_min: %s, r_max:%s, c_min:%s, c_max:%s, move: %s", id, r_min, r_max, c_min, c_max, move)
+        logger.info("Move list: %s", moves)
         # obtain the delta values for x and y
         delta_r, delta_c = effects[move]
 
@@ -111,12 +107,11 @@ def create(map_data, points, D=5):
         c_min_new = c_min + delta_c if delta_c < 0 else c_min
         c_max_new = c_max + delta_c if delta_c > 0 else c_max
 
-        logger.info(
-            "Tentative: r_min: {}, r_max:{}, c_min:{}, c_max:{}".format(r_min_new, r_max_new, c_min_new, c_max_new))
+        logger.info("Tentative: r_min: %s, r_max:%s, c_min:%s, c_max:%s", r_min_new, r_max_new, c_min_new, c_max_new)
         try:
             collisions = update_graph_map(map_data, graph_map, id, r_min_new, r_max_new, c_min_new, c_max_new)
             if len(collisions) > 0:
-                logger.info("Found collisions between when expanding structure {}".format(id))
+                logger.info("Found collisions between when expanding structure %s", id)
                 for other_id, r, c in collisions:
                     if other_id not in cluster_collisions[id].keys():
                         # logger.info("id: {}, other_id: {}, r: {}, c: {}".format(id, other_id, r, c))
@@ -124,8 +119,8 @@ def create(map_data, points, D=5):
                         other_c = c - 1 if move == "r" else c + 1 if move == "l" else c
                         cluster_collisions[id][other_id] = (r, c)
                         cluster_collisions[other_id][id] = (other_r, other_c)
-                        logger.info("Expanding Structure structure {}, r {}, c {}".format(id, other_r, other_c))
-                        logger.info("Collided structure {}, r {}, c {}".format(other_id, r, c))
+                        logger.info("Expanding Structure structure %s, r %s, c %s", id, other_r, other_c)
+                        logger.info("Collided structure %s, r %s, c %s", other_id, r, c)
 
                         connecting_nodes.append([r, c, move, id])
                         connecting_nodes.append([other_r, other_c, switcher[move], other_id])
@@ -151,13 +146,12 @@ def create(map_data, points, D=5):
 
     logger.info("Clusters at the end of expansions: ")
     for id, r_min, x_max, c_min, c_max in finished_clusters:
-        logger.info(
-            "id: {}, r_min: {}, r_max:{}, c_min:{}, c_max:{}, move: {}".format(id, r_min, x_max, c_min, c_max, move))
+        logger.info("id: %s, r_min: %s, r_max:%s, c_min:%s, c_max:%s, move: %s", id, r_min, x_max, c_min, c_max, move)
 
     logger.info("Connecting nodes: ")
     for c in connecting_nodes:
         # logger.info("Node structure_id: {}, r: {}, c: {} ".format(c.structure.id, c.r, c.c))
-        logger.info("Node: {}".format(c))
+        logger.info("Node: %s", c)
         # logger.info(c.edges)
 
     structures = generate_structures(graph_map, connecting_nodes)
@@ -171,6 +165,7 @@ def create(map_data, points, D=5):
 
 def generate_structures(graph_map, connecting_nodes):
     structures = {}
+    nodes = {}
 
     for r in range(len(graph_map)):
         for c in range(len(graph_map[r])):
@@ -179,9 +174,16 @@ def generate_structures(graph_map, connecting_nodes):
             if n is not None:
                 if n[1] not in structures.keys():
                     structures[n[1]] = Structure(n[1])
+                    nodes[n[1]] = ([], [], [], [])
+
+                rows, cols, tiles, solid = nodes[n[1]]
+                rows.append(r)
+                cols.append(c)
+                tiles.append(n[0])
+                solid.append(n[0] in constants.platform_tiles)
 
-                node = Node(r, c, n[0], "Solid" if n[0] in constants.platform_tiles else "Non-Solid", structures[n[1]])
-                structures[n[1]].append_node(node)
+    for id, (rows, cols, tiles, solid) in nodes.items():
+        structures[id].add_nodes(rows, cols, tiles, solid)
 
     for r, c, direction, id in connecting_nodes:
         connector = Connector(r, c, direction, structures[id])
@@ -1,45 +1,40 @@
 import logging
+import random
 from .level import Level
+from . import tile_codec
 from .point_selection import spaced_selection, evenly_spaced_selection
 from . import structure_creation
+from helper.log import Lazy
 
 logger = logging.getLogger(__name__)
 
 
 def read_level(path):
-    logger.info("Reading {}".format(path))
+    logger.info("Reading %s", path)
     # read map as rows x columns
-    map_data = []
-    input_file = open(path, "r")
-    for line in input_file:
-        map_data.append([])
-        for char in line:
-            if char == "\n": continue
-            map_data[-1].append(char)
+    map_data = tile_codec.read(path)
 
-    # instantiate map class as columns x rows
+    # the map starts after the blank column every Level is created with
     map_struct = Level()
-    for j in range(len(map_data[0])):
-        for i in range(len(map_data)):
-            map_struct.append(map_data[i][j])
+    map_struct.paste_grid(map_data, 1)
 
     return map_struct
 
 
-def extract_structures(path_to_map, n, d, step=2):
+def extract_structures(path_to_map, n, d, step=2, rng=random, np_rng=None):
     # Generate a Map-Matrix structure to hold the original map
     map_data = read_level(path_to_map)
-    logger.info("Selected Map File: {}".format(path_to_map))
-    logger.info("Rows: {}, Columns: {}".format(map_data.n_rows, map_data.n_cols))
-    logger.info(map_data.pretty_print())
+    logger.info("Selected Map File: %s", path_to_map)
+    logger.info("Rows: %s, Columns: %s", map_data.n_rows, map_data.n_cols)
+    logger.debug("%s", Lazy(map_data.pretty_print))
 
     # while True:
     # Step 1
     # Select N points from the map, with D distance from each other
     min_dist = 4
     # selected_points = evenly_spaced_selection(map_data, n)
-    selected_points = spaced_selection(map_data, n, min_dist)
-    logger.info("Selected points ({}): {}".format(n, selected_points))
+    selected_points = spaced_selection(map_data, n, min_dist, rng, np_rng)
+    logger.info("Selected points (%s): %s", n, selected_points)
 
     # Step 2
     # Select structures expanding from previously selected points
@@ -49,7 +44,7 @@ def extract_structures(path_to_map, n, d, step=2):
     structures = structure_creation.create(map_data, selected_points, d)
     logger.info("Selected structures: ")
     for s in structures:
-        logger.info("\n{}".format(s.pretty_print(True)))
+        logger.debug("\n%s", Lazy(s.pretty_print, True))
 
     # connectors = []
     # for s in structures:
@@ -61,12 +56,12 @@ def extract_structures(path_to_map, n, d, step=2):
     # else:
     #   break
 
-    logger.info("Used n: {}".format(n))
+    logger.info("Used n: %s", n)
     # Relativize the node position of all structures, so that the
     # left-most node start at column 0
     logger.info("Structures after relativization:")
     for s in structures:
         s.relativize_coordinates()
-        logger.info("\n{}".format(s.pretty_print()))
+        logger.debug("\n%s", Lazy(s.pretty_print))
 
     return structures
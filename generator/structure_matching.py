@@ -1,24 +1,43 @@
 import logging
-import copy
+from collections import namedtuple
+
+from . import footprint
 from .reachability import is_reachable
 
 logger = logging.getLogger(__name__)
 
+# How structure s2 is placed on connector sub1 of s1 through its connector
+# sub2, in the frame of s1: the offset prepare gives s2 and the footprint of
+# s2 there. The footprint is clipped to the 16 level rows but keeps the
+# columns left of 0, so it only has to be moved by the column of s1.
+Substitution = namedtuple("Substitution", ["offset", "footprint"])
+
+
+def substitution(s1, sub1, s2, sub2):
+    """Substitution placing connector sub2 of s2 against connector sub1 of s1, the same way prepare does"""
+    horizontal = {"r": -1, "l": 1, "u": 0, "d": 0}
+    vertical = {"r": 0, "l": 0, "u": -1, "d": 1}
+
+    dr = s1.conn_rows[sub1] + vertical[s2.conn_dirs[sub2]] - s2.conn_rows[sub2]
+    dc = s1.conn_cols[sub1] + horizontal[s1.conn_dirs[sub1]] - s2.conn_cols[sub2]
+    return Substitution((dr, dc), footprint.shifted(s2.footprint(), dr, dc))
+
 
 def do_overlap(s1, s2):
-    for n1 in s1.nodes:
-        for n2 in s2.nodes:
-            if n1.c == n2.c and n1.r == n2.r:
-                logger.debug("Overlap Ocurred between structures {} and {}".format(s1.id, s2.id))
-                return True
+    """Check whether the nodes of two structures share a cell inside the level"""
+    if footprint.overlap(s1.footprint(), s2.footprint()):
+        logger.debug("Overlap Ocurred between structures %s and %s", s1.id, s2.id)
+        return True
     return False
 
 
 def are_combinable(s1, s2, n1, n2, d1, d2):
-    logger.debug("Checking combinability of {} (id{}) and {} (id{})".format(n1, s1.id, n2, s2.id))
+    logger.debug("Checking combinability of %s (id%s) and %s (id%s)", n1, s1.id, n2, s2.id)
 
     logger.debug("Before adjustment: ")
-    logger.debug(s2.nodes + s2.connecting)
+    if logger.isEnabledFor(logging.DEBUG):
+        # connectors show their combinations, which are still being added
+        logger.debug("%s", repr(s2.nodes + s2.connecting))
 
     horizontal = {"r": -1, "l": 1, "u": 0, "d": 0}
     vertical = {"r": 0, "l": 0, "u": -1, "d": 1}
@@ -26,33 +45,27 @@ def are_combinable(s1, s2, n1, n2, d1, d2):
     adjust_col = (n1.c + (horizontal[d1])) - n2.c
     adjust_row = (n1.r + (vertical[d1])) - n2.r
 
-    s2_adjusted = copy.deepcopy(s2)
-
-    for n in s2_adjusted.nodes + s2_adjusted.connecting:
-        n.c += adjust_col
-        n.r += adjust_row
-
-    for i in range(len(s2_adjusted.nodes) - 1, -1, -1):
-        n = s2_adjusted.nodes[i]
-        if n.r < 0 or n.r > 15 or n.c < 0:
-            s2_adjusted.nodes.remove(n)
+    s2_adjusted = s2.translated(adjust_row, adjust_col)
 
-    for i in range(len(s2_adjusted.connecting) - 1, -1, -1):
-        n = s2_adjusted.connecting[i]
-        if n.r < 0 or n.r > 15 or n.c < 0:
-            s2_adjusted.connecting.remove(n)
+    # the footprint is clipped to the level already, so overlapping pairs
+    # are rejected before paying for the clipped copy
+    if do_overlap(s1, s2_adjusted):
+        return False
+    s2_adjusted.clip()
 
     logger.debug("After adjustment: ")
-    logger.debug(s2_adjusted.nodes + s2_adjusted.connecting)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s", repr(s2_adjusted.nodes + s2_adjusted.connecting))
 
-    # Check collisions and reachability between s1 and s2
-    if not do_overlap(s1, s2_adjusted) and is_reachable(s1, s2_adjusted):
-        return True
-    else:
-        return False
+    # Check reachability between s1 and s2
+    return is_reachable(s1, s2_adjusted)
 
 
 def compute_combinations(structures):
+    """
+    Find the connector pairs of the structures that can be combined, filling
+    in the combinable list and the placements table of both connectors
+    """
     main_directions = {"r", "u"}
     opposite_directions = {"r": "l", "l": "r", "u": "d", "d": "u"}
 
@@ -62,14 +75,14 @@ def compute_combinations(structures):
 
     # go through all structures checking connecting nodes
     for s1 in structures:
-        logger.debug("-Start: connecting structures in {}".format(s1.id))
+        logger.debug("-Start: connecting structures in %s", s1.id)
 
         for n1 in s1.connecting:
             direction = n1.direction
-            logger.debug("--Start: Processing connecting node {}, direction: {}".format(n1, direction))
+            logger.debug("--Start: Processing connecting node %s, direction: %s", n1, direction)
 
             if direction not in main_directions:
-                logger.debug("--Finish: Processing connecting node {}".format(n1))
+                logger.debug("--Finish: Processing connecting node %s", n1)
                 continue
             opposite = opposite_directions[direction]
 
@@ -84,16 +97,18 @@ def compute_combinations(structures):
                     if n2_direction == opposite:
                         # second if ensures that both nodes connect at the same height
                         if n2_direction == "d" or n1.r == n2.r:
-                            logger.debug("---Opposing Node: {}, Direction: {}".format(n2, n2_direction))
+                            logger.debug("---Opposing Node: %s, Direction: %s", n2, n2_direction)
 
                             combinable = are_combinable(s1, s2, n1, n2, direction, opposite)
 
                             if combinable:
-                                logger.info("--- Combinable ({}): n1 {}, ({}): n2 {}".format(s1.id, n1, s2.id, n2))
+                                logger.info("--- Combinable (%s): n1 %s, (%s): n2 %s", s1.id, n1, s2.id, n2)
                                 n1.combinable.append((s2.id, n2.sub_id))
                                 n2.combinable.append((s1.id, n1.sub_id))
+                                s1.placements[n1.sub_id][(s2.id, n2.sub_id)] = substitution(s1, n1.sub_id, s2, n2.sub_id)
+                                s2.placements[n2.sub_id][(s1.id, n1.sub_id)] = substitution(s2, n2.sub_id, s1, n1.sub_id)
                             else:
                                 logger.debug("--- Not combinable")
 
-            logger.debug("--Finish: Processing connecting node {}".format(n1))
-        logger.debug("-Finish: connecting structures in {}".format(s1.id))
+            logger.debug("--Finish: Processing connecting node %s", n1)
+        logger.debug("-Finish: connecting structures in %s", s1.id)
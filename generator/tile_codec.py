@@ -0,0 +1,82 @@
+"""
+Conversion between tile grids and the MarioAI text format.
+
+A grid is a row-major (rows, columns) uint8 array holding the byte value of
+each tile, e.g. Level.rows. Every conversion works on whole rows at once
+instead of going through Level.get tile by tile.
+"""
+import numpy as np
+
+NEWLINE = ord("\n")
+
+
+def encode(grid):
+    """Return the text of a grid, one line per row, each ending in a newline"""
+    grid = np.asarray(grid, dtype=np.uint8)
+    text = np.empty((grid.shape[0], grid.shape[1] + 1), dtype=np.uint8)
+    text[:, :-1] = grid
+    text[:, -1] = NEWLINE
+    return text.tobytes().decode("ascii")
+
+
+def encode_rows(grid):
+    """Return each row of a grid as a string"""
+    grid = np.ascontiguousarray(grid, dtype=np.uint8)
+    return [row.tobytes().decode("ascii") for row in grid]
+
+
+def to_matrix(grid):
+    """Return a grid as a list of rows, each a list of one-character strings"""
+    return [list(row) for row in encode_rows(grid)]
+
+
+def from_matrix(matrix):
+    """
+    Inverse of to_matrix, also accepting a list of row strings. Rows
+    shorter than the widest one, e.g. the last line of a file without a
+    trailing newline, are padded with air
+    """
+    width = max((len(row) for row in matrix), default=0)
+    data = "".join("".join(row).ljust(width, "-") for row in matrix).encode("ascii")
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(matrix), width).copy()
+
+
+def decode(text):
+    """Parse MarioAI level text into a grid. All rows must have the same width"""
+    lines = text.splitlines()
+    data = "".join(lines).encode("ascii")
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(lines), -1).copy()
+
+
+def write(grid, path):
+    with open(path, "w") as output_file:
+        output_file.write(encode(grid))
+
+
+def read(path):
+    with open(path, "r") as input_file:
+        return decode(input_file.read())
+
+
+def from_nodes(rows, cols, codes, n_rows=16, n_cols=None, filler="-"):
+    """
+    Build a grid from parallel arrays of node rows, columns and tile codes.
+    The grid is wide enough for the right-most node (at least one column),
+    nodes outside of it are dropped and later nodes win on duplicates.
+    """
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    codes = np.asarray(codes, dtype=np.uint8)
+    if n_cols is None:
+        n_cols = int(cols.max()) + 1 if len(cols) > 0 else 1
+        n_cols = max(n_cols, 1)
+
+    grid = np.full((n_rows, n_cols), ord(filler), dtype=np.uint8)
+    inside = (rows >= 0) & (rows < n_rows) & (cols >= 0) & (cols < n_cols)
+    grid[rows[inside], cols[inside]] = codes[inside]
+    return grid
+
+
+def codes_of(tiles):
+    """Return the tile codes of a sequence of one-character strings"""
+    return np.frombuffer("".join(tiles).encode("ascii"), dtype=np.uint8)
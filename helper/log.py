@@ -1,6 +1,8 @@
 import os
 import logging
 import logging.handlers
+import multiprocessing
+import queue
 
 
 # use this to set a size limit for the log.log file
@@ -22,3 +24,101 @@ class TruncatedFileHandler(logging.handlers.RotatingFileHandler):
         os.remove(dfn)
         self.mode = 'w'
         self.stream = self._open()
+
+
+class Lazy:
+    """
+    Defer building a log argument until the record is actually written,
+    e.g. logger.debug("\n%s", Lazy(structure.pretty_print)). Dumps passed
+    this way cost nothing when their level is disabled or the record is
+    dropped by a filter such as SampledFilter. They are drawn later by the
+    logging thread, so pass copies of what keeps changing.
+    """
+    __slots__ = ("function", "args")
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __str__(self):
+        return str(self.function(*self.args))
+
+
+class SampledFilter(logging.Filter):
+    """
+    Keep one of every `every` records below `level`, so a trace of the hot
+    loops can stay enabled on long runs. Records at `level` and above are
+    always kept.
+    """
+
+    def __init__(self, every, level=logging.WARNING):
+        super(SampledFilter, self).__init__()
+        self.every = max(1, every)
+        self.level = level
+        self._seen = 0
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+        self._seen += 1
+        return (self._seen - 1) % self.every == 0
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler for a queue.Queue read in the same process. Records are
+    queued as they are and formatted by the listener's handler, on its
+    thread, so their arguments (Lazy dumps included) are only rendered there
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def parse_levels(text):
+    """Parse per-module levels given as "generator.reachability=WARNING,generator=INFO" """
+    levels = {}
+    for item in filter(None, (text or "").split(",")):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def attach(log_queue, level=logging.INFO, levels=None, every=1):
+    """
+    Send the records of this process to log_queue instead of writing them,
+    e.g. in a worker process. levels maps logger names to their own level,
+    and every > 1 samples the records below WARNING (see SampledFilter).
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if isinstance(log_queue, queue.Queue):
+        handler = LocalQueueHandler(log_queue)
+    else:
+        # records sent to another process are pickled, they have to be formatted here
+        handler = logging.handlers.QueueHandler(log_queue)
+    if every > 1:
+        handler.addFilter(SampledFilter(every))
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, module_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+
+def start_logging(path, level=logging.INFO, max_bytes=0, levels=None, every=1, shared=False):
+    """
+    Write the log records to path from a background thread, so logging only
+    costs the hot loops a queue put, formatting included unless shared. The
+    file is truncated whenever it grows past max_bytes (0 for no limit).
+    With shared, the queue can also be handed to worker processes (see
+    attach).
+    Returns the QueueListener, stop it to flush the file at the end of a run.
+    """
+    log_queue = multiprocessing.Queue() if shared else queue.Queue()
+    handler = TruncatedFileHandler(path, "w", max_bytes)
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    attach(log_queue, level, levels, every)
+    return listener
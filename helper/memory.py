@@ -0,0 +1,175 @@
+"""
+Memory accounting of a run, saved as memory.json.
+
+Once start has been called, tracemalloc traces every allocation and each
+block run under measure or stage(name) reports its peak, the bytes it kept
+allocated and the allocation sites those bytes came from. Peaks are those
+of the whole process, so the pipeline threads running at the same time
+count too. deep_size adds up the objects a structure is made of, which
+gives the bytes per library structure, and the bytes per placement of the
+levels being generated, without the library structures they share.
+
+Independently of tracing, limit (bytes) is checked against the resident
+memory of the process by over_limit, so a run can shed its caches or stop
+before the machine runs out of memory.
+"""
+import gc
+import json
+import os
+import sys
+import threading
+import tracemalloc
+import types
+from contextlib import contextmanager
+
+limit = None  # resident bytes the process may use, see over_limit
+sites = 10  # allocation sites kept per stage
+
+_lock = threading.Lock()
+_own = [tracemalloc.Filter(False, tracemalloc.__file__)]  # leave out the snapshots themselves
+stages = {}  # name -> {"calls", "peak_bytes", "retained_bytes", "sites": {file:line -> bytes}}
+library = {}
+_library = []  # structures of add_library, kept alive so the ids in _library_ids stay theirs
+_library_ids = set()
+levels = {"count": 0, "placed_structures": 0, "bytes": 0}
+
+
+def start(frames=1):
+    tracemalloc.start(frames)
+
+
+def tracing():
+    return tracemalloc.is_tracing()
+
+
+def resident_bytes():
+    """Resident memory of the process, its peak where the current one can't be read"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # KiB on Linux
+
+
+def over_limit():
+    return limit is not None and resident_bytes() > limit
+
+
+@contextmanager
+def measure():
+    """
+    Yield a dict filled in, once the block is done, with its peak and
+    retained bytes and the sites that allocated the retained bytes.
+    Empty if tracing hasn't been started
+    """
+    usage = {}
+    if not tracemalloc.is_tracing():
+        yield usage
+        return
+    before = tracemalloc.take_snapshot().filter_traces(_own)
+    current_before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    try:
+        yield usage
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        growth = tracemalloc.take_snapshot().filter_traces(_own).compare_to(before, "lineno")
+        usage.update(peak_bytes=peak, retained_bytes=current - current_before, sites={
+            "{}:{}".format(stat.traceback[0].filename, stat.traceback[0].lineno): stat.size_diff
+            for stat in growth[:sites] if stat.size_diff > 0})
+
+
+@contextmanager
+def stage(name):
+    """Measure the block as a call of stage name"""
+    with measure() as usage:
+        yield usage
+    if usage:
+        add(name, usage)
+
+
+def add(name, usage):
+    """Add what measure reported, possibly in another process, to stage name"""
+    with _lock:
+        stage = stages.setdefault(name, {"calls": 0, "peak_bytes": 0, "retained_bytes": 0, "sites": {}})
+        stage["calls"] += 1
+        stage["peak_bytes"] = max(stage["peak_bytes"], usage["peak_bytes"])
+        stage["retained_bytes"] += usage["retained_bytes"]
+        for site, size in usage["sites"].items():
+            stage["sites"][site] = stage["sites"].get(site, 0) + size
+
+
+def deep_size(obj, seen=None):
+    """
+    Bytes of obj and of everything it references, skipping classes,
+    modules and functions, and the objects whose ids are in seen (which
+    gets the ids of the objects counted)
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    todo = [obj]
+    while todo:
+        o = todo.pop()
+        if id(o) in seen or isinstance(o, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        todo.extend(gc.get_referents(o))
+    return size
+
+
+def add_library(structures):
+    seen = set()
+    size = deep_size(structures, seen)
+    with _lock:
+        library.update(structures=len(structures), bytes=size, bytes_per_structure=size / max(len(structures), 1))
+        _library[:] = structures
+        _library_ids.update(seen)
+
+
+def placements_size(placements):
+    """Bytes of a list of placements, without the library structures of add_library"""
+    with _lock:
+        seen = set(_library_ids)
+    return deep_size(placements, seen)
+
+
+def add_level(size, placements):
+    """Count a generated level whose placements take size bytes"""
+    with _lock:
+        levels["count"] += 1
+        levels["placed_structures"] += placements
+        levels["bytes"] += size
+
+
+def report(**extra):
+    with _lock:
+        placed = levels["placed_structures"]
+        result = dict(extra, resident_bytes=resident_bytes(), limit_bytes=limit, library=dict(library),
+                      levels=dict(levels, bytes_per_placed_structure=levels["bytes"] / placed if placed else None),
+                      stages={})
+        for name, stage in stages.items():
+            top = sorted(stage["sites"].items(), key=lambda item: -item[1])[:sites]
+            result["stages"][name] = dict(stage, sites=dict(top))
+        return result
+
+
+def save(path, **extra):
+    with open(path, "w") as f:
+        json.dump(report(**extra), f, indent=2, default=str)
+
+
+def summary():
+    """Lines describing the peak and retained bytes of every stage"""
+    lines = ["{:<24} {:>12} {:>14}".format("stage", "peak MiB", "retained MiB")]
+    with _lock:
+        for name, stage in stages.items():
+            lines.append("{:<24} {:>12.1f} {:>14.1f}".format(name, stage["peak_bytes"] / 2 ** 20,
+                                                             stage["retained_bytes"] / 2 ** 20))
+        if library:
+            lines.append("{:.0f} bytes per structure".format(library["bytes_per_structure"]))
+        if levels["placed_structures"]:
+            lines.append("{:.0f} bytes per placed structure".format(levels["bytes"] / levels["placed_structures"]))
+    return lines
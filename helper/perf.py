@@ -0,0 +1,61 @@
+"""
+Timings and event counters of a run, saved as perf.json.
+
+Stages are timed with `with perf.timer("name"):` or by wrapping a function
+with perf.timed, and accumulate their total seconds and number of calls.
+Counters add up events reported by the generator (see generate_level's
+events). Both are safe to update from the pipeline threads.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_lock = threading.Lock()
+_started = time.perf_counter()
+stages = {}  # name -> {"seconds": total, "calls": count}
+counters = {}  # name -> count
+
+
+def add_time(name, seconds, calls=1):
+    with _lock:
+        stage = stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        stage["seconds"] += seconds
+        stage["calls"] += calls
+
+
+def add_counts(events):
+    with _lock:
+        for name, value in events.items():
+            counters[name] = counters.get(name, 0) + value
+
+
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start)
+
+
+def timed(name, function):
+    """Return function timed as stage name"""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with timer(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def report(**extra):
+    """Everything recorded so far, plus the wall time since the run started"""
+    with _lock:
+        return dict(extra, wall_seconds=time.perf_counter() - _started,
+                    stages={name: dict(stage) for name, stage in stages.items()}, counters=dict(counters))
+
+
+def save(path, **extra):
+    with open(path, "w") as f:
+        json.dump(report(**extra), f, indent=2, default=str)
@@ -0,0 +1,164 @@
+"""
+Optional profiles of the stages of a run.
+
+Once configure has been called, every block run under stage(name) is
+profiled with cProfile, or with the "sample" profiler by a thread
+recording its collapsed stacks ("outer;inner;leaf count" lines, the input
+of flamegraph tools), which costs far less and can stay on in production
+runs. Calls of the same stage add up, also across threads. dump writes
+<stage>.prof (readable with pstats or snakeviz) or <stage>.collapsed to
+the profile directory.
+"""
+import collections
+import cProfile
+import glob
+import os
+import pstats
+import sys
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+directory = None  # nothing is profiled until configure is called
+profiler = "cprofile"
+interval = 0.005  # seconds between stack samples
+
+_lock = threading.Lock()
+_stats = {}  # stage -> pstats.Stats of all its calls
+_samples = {}  # stage -> Counter of collapsed stacks
+
+
+def configure(path, mode="cprofile"):
+    global directory, profiler
+    os.makedirs(path, exist_ok=True)
+    directory, profiler = path, mode
+
+
+class Sampler(threading.Thread):
+    """Count the collapsed stacks of one thread, sampled every interval seconds"""
+
+    def __init__(self, thread_id, interval=0.005):
+        super(Sampler, self).__init__(name="sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.stacks
+
+
+@contextmanager
+def stage(name):
+    """Profile the block as a call of stage name, if profiling is configured"""
+    if directory is None:
+        yield
+        return
+    profile = cProfile.Profile() if profiler == "cprofile" else None
+    if profile is not None:
+        try:
+            profile.enable()
+        except ValueError:
+            # from Python 3.12 only one profiler runs at a time, the other stages are only sampled
+            profile = None
+    sampler = None
+    if profile is None:
+        sampler = Sampler(threading.get_ident(), interval)
+        sampler.start()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+        add(name, profile and pstats.Stats(profile), sampler.stop() if sampler is not None else {})
+
+
+def profiled(name, function):
+    """Return function profiled as stage name"""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def add(name, stats, stacks):
+    with _lock:
+        if stats is not None:
+            if name in _stats:
+                _stats[name].add(stats)
+            else:
+                _stats[name] = stats
+        if stacks:
+            _samples.setdefault(name, collections.Counter()).update(stacks)
+
+
+def dump(name=None, forget=False):
+    """Write the files of one stage, or of every stage, recorded so far"""
+    with _lock:
+        for stage_name in [name] if name is not None else list(set(_stats) | set(_samples)):
+            stats = _stats.pop(stage_name, None) if forget else _stats.get(stage_name)
+            stacks = _samples.pop(stage_name, None) if forget else _samples.get(stage_name)
+            if stats is not None:
+                stats.dump_stats(os.path.join(directory, stage_name + ".prof"))
+            if stacks is not None:
+                with open(os.path.join(directory, stage_name + ".collapsed"), "w") as f:
+                    for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                        f.write("{} {}\n".format(stack, count))
+
+
+def load(name, pattern, remove=False):
+    """
+    Add the files matching pattern (e.g. "level_*", written by worker
+    processes) to stage name, removing them if asked to
+    """
+    for prof in glob.glob(os.path.join(directory, pattern + ".prof")):
+        add(name, pstats.Stats(prof), {})
+        if remove:
+            os.remove(prof)
+    for collapsed in glob.glob(os.path.join(directory, pattern + ".collapsed")):
+        stacks = collections.Counter()
+        with open(collapsed) as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                stacks[stack] += int(count)
+        add(name, None, stacks)
+        if remove:
+            os.remove(collapsed)
+
+
+def top(n=15):
+    """Lines describing the n functions with the most own time over every stage"""
+    with _lock:
+        if _stats:
+            merged = pstats.Stats()
+            merged.add(*_stats.values())
+            rows = sorted(merged.stats.items(), key=lambda item: -item[1][2])[:n]
+            lines = ["{:>10} {:>10} {:>10}  function".format("own s", "total s", "calls")]
+            for (path, line, function), (_, calls, own, total, _) in rows:
+                lines.append("{:>10.3f} {:>10.3f} {:>10}  {}:{}({})".format(
+                    own, total, calls, os.path.basename(path), line, function))
+            return lines
+
+        # only samples: count the samples each function was running in
+        leaves = collections.Counter()
+        for stacks in _samples.values():
+            for stack, count in stacks.items():
+                leaves[stack.rpartition(";")[2]] += count
+        lines = ["{:>10}  function".format("samples")]
+        for function, count in leaves.most_common(n):
+            lines.append("{:>10}  {}".format(count, function))
+        return lines
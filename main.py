@@ -1,35 +1,32 @@
+import atexit
+import gc
 import logging
-import logging.handlers
 import optparse
 import os
+import random
 import sys
-import time
-import json
+from contextlib import nullcontext
 from datetime import datetime
+from functools import partial, wraps
 from pathlib import Path
 
 import numpy as np
 
 from generator import level_generation
+from generator import pipeline
 from generator import structure_identification
 from generator import structure_matching
+from generator.scoring import DensityScorer
+from generator.nogood import NogoodCache
 from helper import io
-from metrics.level_analysis import generation_times, leniencies, calculate_leniency, linearities, calculate_linearity, \
-    save_data, structures_used_list, level_lengths, line_distances, calculate_line_distance, backtrackings, \
-    analyze_structures, save_structures_data, structures_count_list, used_structures_list
+from helper import log
+from helper import memory
+from helper import perf
+from helper import profiling
+from metrics.level_analysis import calculate_leniency, calculate_linearity, calculate_line_distance, \
+    analyze_structures, save_structures_data, append_data
 from tools.render_level.render_level import render_structure
 
-# uncomment for truncated file
-# filehandler = log.log.TruncatedFileHandler("output/log.log", "w", 9000000)
-# logging.basicConfig(
-# format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-#    level=logging.DEBUG, handlers=[filehandler])
-
-logging.basicConfig(filename="output/log.log",
-                    level=logging.INFO,
-                    filemode='w')
-
-
 def parse_args(args):
     usage = "usage: %prog [options]"
     parser = optparse.OptionParser(usage=usage)
@@ -65,10 +62,90 @@ def parse_args(args):
                       dest="render",
                       help="Render or not levels as png files",
                       default="False")
+    parser.add_option('-a', action="store", type="choice",
+                      dest="search", choices=["random", "beam"],
+                      help="Search used to generate levels: random (backtracking) or beam",
+                      default="random")
+    parser.add_option('-w', action="store", type="int",
+                      dest="beam_width",
+                      help="Number of levels kept on each step of the beam search",
+                      default=1)
+    parser.add_option('-f', action="store", type="choice",
+                      dest="score", choices=["density", "increasing"],
+                      help="Score minimised by the beam search: density or increasing (density)",
+                      default="density")
+    parser.add_option('--workers', action="store", type="int",
+                      dest="workers",
+                      help="Number of processes generating levels, 1 generates them in this process",
+                      default=1)
+    parser.add_option('--io-threads', action="store", type="int",
+                      dest="io_threads",
+                      help="Number of threads measuring, saving and rendering generated levels",
+                      default=2)
+    parser.add_option('--time-budget', action="store", type="float",
+                      dest="time_budget",
+                      help="Seconds each level of the random search may take, the longest level seen is kept",
+                      default=None)
+    parser.add_option('--step-budget', action="store", type="int",
+                      dest="step_budget",
+                      help="Substitutions each level of the random search may try, the longest level seen is kept",
+                      default=None)
+    parser.add_option('--log-level', action="store", type="choice",
+                      dest="log_level", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                      help="Level of output/log.log, DEBUG adds the ASCII dumps of levels and structures",
+                      default="INFO")
+    parser.add_option('--trace-every', action="store", type="int",
+                      dest="trace_every",
+                      help="Only write one of every N records below WARNING, to trace long runs",
+                      default=1)
+    parser.add_option('--log-levels', action="store", type="string",
+                      dest="log_levels",
+                      help="Levels of single modules, e.g. generator.reachability=WARNING,generator.structure_creation=DEBUG",
+                      default="")
+    parser.add_option('--log-max-bytes', action="store", type="int",
+                      dest="log_max_bytes",
+                      help="Size at which the log file of the run is truncated, 0 for no limit",
+                      default=50000000)
+    parser.add_option('--profile', action="store_true",
+                      dest="profile",
+                      help="Profile every stage of the run into the profiles directory of the run",
+                      default=False)
+    parser.add_option('--profiler', action="store", type="choice",
+                      dest="profiler", choices=["cprofile", "sample"],
+                      help="cprofile, or sample to only sample stacks at a much lower cost (cprofile)",
+                      default="cprofile")
+    parser.add_option('--profile-every', action="store", type="int",
+                      dest="profile_every",
+                      help="Only profile the generation of one of every N levels",
+                      default=1)
+    parser.add_option('--profile-per-level', action="store_true",
+                      dest="profile_per_level",
+                      help="Keep the profile of each profiled level, not only their sum",
+                      default=False)
+    parser.add_option('--memory', action="store_true",
+                      dest="memory",
+                      help="Trace allocations and write the peak and retained memory of every stage to memory.json",
+                      default=False)
+    parser.add_option('--max-memory', action="store", type="float",
+                      dest="max_memory",
+                      help="Resident MiB of each process, over it the nogood cache is dropped, then generation stops",
+                      default=None)
+    parser.add_option('--seed', action="store", type="int",
+                      dest="seed",
+                      help="Seed of the run, a random one is drawn (and logged) when not given",
+                      default=None)
     (opt, args) = parser.parse_args()
+    if opt.search == "beam" and (opt.time_budget is not None or opt.step_budget is not None):
+        parser.error("--time-budget and --step-budget only apply to the random search (-a random)")
     return opt, args
 
 
+scores = {
+    "density": DensityScorer.density_score,
+    "increasing": DensityScorer.increasing_density_score
+}
+
+
 def get_level_paths(opt):
     levels = []
     if "txt" in opt.mapfile:
@@ -133,16 +210,17 @@ def save_structures(g_s, g_f, structures, folder):
     output_file.close()
 
 
-def extract_structures(data):
+def extract_structures(data, rng=random, np_rng=None):
     """
   Returns g_s, g_f, and a list of structures given levels in data.
   data: list of tuples of (path, n, d)
+  rng, np_rng: random.Random and numpy Generator used to select the points
   """
     # Randomnly select 'n' points each level in data
     # with a minimum of d size each
     structures = []
     for level, n, d in data:
-        level_structures = structure_identification.extract_structures(level, n, d)
+        level_structures = structure_identification.extract_structures(level, n, d, rng=rng, np_rng=np_rng)
         structures.extend(level_structures)
 
     # Instiate the base starting and finishing structures
@@ -151,7 +229,7 @@ def extract_structures(data):
     return g_s, g_f, structures
 
 
-def get_subset(structures, n=0.1):
+def get_subset(structures, n=0.1, np_rng=None):
     """
   Given a list of structures, return a list with n% of them.
   The probability of selection of a given structure is
@@ -183,8 +261,9 @@ def get_subset(structures, n=0.1):
     probab_list = [x / sum(probab_list) for x in probab_list]
 
     n_select = int(len(structures) * n)
-    selected = np.random.choice(struct_list, n_select,
-                                replace=False, p=probab_list)
+    np_rng = np.random if np_rng is None else np_rng
+    selected = np_rng.choice(struct_list, n_select,
+                             replace=False, p=probab_list)
     return selected.tolist()
 
 
@@ -198,11 +277,176 @@ def minimize_combinations(structures):
 
     for s in structures:
         for c in s.connecting:
-            logging.info("combinables before: {}".format(c.combinable))
+            logging.info("combinables before: %s", c.combinable)
             for s2_id, s2_c in reversed(c.combinable):
                 if s2_id not in ids:
                     c.combinable.remove((s2_id, s2_c))
-            logging.info("combinables after: {}".format(c.combinable))
+            logging.info("combinables after: %s", c.combinable)
+
+
+# spawn keys of the random streams derived from the seed of a run
+EXTRACTION_STREAM = 0
+LEVEL_STREAMS = 1
+
+
+def make_rngs(seed_sequence):
+    """Return a random.Random and a numpy Generator drawing from a numpy SeedSequence"""
+    state = seed_sequence.generate_state(4)
+    return random.Random(int.from_bytes(state.tobytes(), "little")), np.random.default_rng(seed_sequence)
+
+
+def stream(seed, *spawn_key):
+    """
+    Random streams of one part of a run, e.g. stream(seed, LEVEL_STREAMS, n)
+    for level n. They only depend on the seed and the key, so a level is the
+    same whichever process generates it and in which order.
+    """
+    return make_rngs(np.random.SeedSequence(seed, spawn_key=spawn_key))
+
+
+def generate(n, g_s, g_f, structures, opt):
+    """Generate level n, returning a GeneratedLevel or None if generation failed"""
+    rng, _ = stream(opt.seed, LEVEL_STREAMS, n)
+    profile = profiled_level(opt, n)
+    with memory.measure() as usage, profiling.stage(f"level_{n}") if profile else nullcontext():
+        generated = pipeline.generate_one(n, structures, g_s, g_f, rng, opt.search, opt.min_structures,
+                                          opt.beam_width, scores[opt.score], opt.time_budget, opt.step_budget,
+                                          nogoods)
+    if profile:
+        # written as soon as the level is done, also by worker processes, and summed up at the end of the run
+        profiling.dump(f"level_{n}", forget=True)
+    if generated is None:
+        return None
+    if usage:
+        usage.update(placement_bytes=memory.placements_size(generated.placements),
+                     placements=len(generated.placements))
+    # the placements refer to the whole library, don't send them to the main process or keep them queued
+    return generated._replace(placements=None, memory=usage or None)
+
+
+def within_memory_limit(n):
+    """
+    Whether level n may be generated without going over --max-memory,
+    after dropping the nogood cache if needed. Levels come out the same
+    without the cache, only slower
+    """
+    if not memory.over_limit():
+        return True
+    logging.warning("Over the memory limit before level %s, dropping %s nogood contexts", n, len(nogoods))
+    nogoods.clear()
+    gc.collect()
+    if memory.over_limit():
+        logging.warning("Still over the memory limit (%s bytes resident), level %s is not generated",
+                        memory.resident_bytes(), n)
+        return False
+    return True
+
+
+def measure(generated):
+    """Metrics of a generated level, one row of data_collected.csv"""
+    level_data = generated.level.matrix_representation()
+    # print(*level_data, sep='\n')
+
+    return {
+        "time": generated.time,
+        "leniency": calculate_leniency(level_data),
+        "linearity": calculate_linearity(level_data),
+        "line_distance": calculate_line_distance(level_data),
+        "backtrackings": generated.backtracks,
+        "structures_used": generated.substitutions,
+        "structures_count": len(generated.used_structures),
+        "level_length": len(level_data[0]),
+        "used_structures": generated.used_structures,
+        "stop_reason": generated.stop_reason
+    }
+
+
+def record(generated, results, data_path):
+    # results[0] is what measure returned, see consumers
+    append_data(data_path, results[0])
+    if generated.memory is not None:
+        memory.add("generate", generated.memory)
+        memory.add_level(generated.memory["placement_bytes"], generated.memory["placements"])
+    perf.add_time("generate", generated.time)
+    perf.add_counts(generated.events)
+    perf.add_counts({"levels": 1})
+
+
+def save(generated, levels_output_dir):
+    generated.level.save_as_level(f"{levels_output_dir}/level_{generated.n}.txt")
+
+
+def render(generated, levels_output_dir):
+    print("Rendering level {}".format(generated.n))
+    level_path = f"{levels_output_dir}/level_{generated.n}"
+    render_structure(f"{level_path}.txt", f"{level_path}.png")
+
+
+def profiled_level(opt, n):
+    """Whether level n is profiled, see --profile-every"""
+    return opt.profile and n % opt.profile_every == 0
+
+
+def consumers(opt, output_dir, levels_output_dir):
+    """
+    Pipeline measuring, saving and rendering every generated level on
+    opt.io_threads threads, writing the metrics rows in level order.
+    The stages are only profiled for the levels whose generation is
+    """
+    def stage(name, function):
+        profiled = profiling.profiled(name, function)
+
+        @wraps(function)
+        def wrapper(generated, *args):
+            if profiled_level(opt, generated.n):
+                return profiled(generated, *args)
+            return function(generated, *args)
+        return perf.timed(name, wrapper)
+
+    stages = [stage("measure", measure),
+              stage("save", partial(save, levels_output_dir=levels_output_dir))]
+    if opt.render == "True":
+        stages.append(stage("render", partial(render, levels_output_dir=levels_output_dir)))
+    ordered = [stage("record", partial(record, data_path=f"output/{output_dir}/data_collected.csv"))]
+    return pipeline.Pipeline(stages, maxsize=2 * opt.io_threads, workers=opt.io_threads, ordered=ordered)
+
+
+# structure library of a worker process, sent once when the process starts
+worker_library = None
+# dead ends learned so far, shared by the levels generated in this process
+nogoods = NogoodCache()
+
+
+def init_worker(g_s, g_f, structures, opt, log_queue, profile_dir=None):
+    global worker_library
+    sys.setrecursionlimit(10000)
+    log.attach(log_queue, opt.log_level, log.parse_levels(opt.log_levels), opt.trace_every)
+    if profile_dir is not None:
+        profiling.configure(profile_dir, opt.profiler)
+    if opt.memory:
+        memory.start()
+        memory.add_library(structures + [g_s, g_f])
+    memory.limit = memory_limit(opt)
+    worker_library = (g_s, g_f, structures)
+
+
+def generate_in_worker(n, opt):
+    g_s, g_f, structures = worker_library
+    if not within_memory_limit(n):
+        return None
+    return generate(n, g_s, g_f, structures, opt)
+
+
+def memory_limit(opt):
+    return None if opt.max_memory is None else int(opt.max_memory * 2 ** 20)
+
+
+def memory_left(n):
+    """Whether the run goes on with level n, stopping once this process is over --max-memory"""
+    if within_memory_limit(n):
+        return True
+    print(f"- Over the memory limit, stopping after {n} levels")
+    return False
 
 
 if __name__ == '__main__':
@@ -211,6 +455,10 @@ if __name__ == '__main__':
     print("- Setting recursion limit")
     sys.setrecursionlimit(10000)  # required for some of the operations
 
+    if opt.seed is None:
+        opt.seed = np.random.SeedSequence().entropy
+    print(f"- Seed: {opt.seed}")
+
 # # make sure the output directory exists, otherwise create it
 # Path("output/structures/").mkdir(parents=True, exist_ok=True)
 # Path("output/levels/").mkdir(parents=True, exist_ok=True)
@@ -228,12 +476,25 @@ if __name__ == '__main__':
     structures_output_dir.mkdir(parents=True, exist_ok=True)
     levels_output_dir.mkdir(parents=True, exist_ok=True)
 
+    # each run logs to its own file, written by a background thread
+    log_listener = log.start_logging(f"output/{output_dir}/log.log", opt.log_level, opt.log_max_bytes,
+                                     log.parse_levels(opt.log_levels), opt.trace_every, shared=opt.workers > 1)
+    atexit.register(log_listener.stop)
+    logging.info("Seed: %s", opt.seed)
+
+    if opt.profile:
+        profiling.configure(f"output/{output_dir}/profiles", opt.profiler)
+    if opt.memory:
+        memory.start()
+    memory.limit = memory_limit(opt)
+
     print("- Getting level data")
     data = get_level_paths(opt)
 
     # g_s, g_f, structures = load_structures()
     print("- Extracting structures")
-    g_s, g_f, structures = extract_structures(data)
+    with perf.timer("extract_structures"), profiling.stage("extract_structures"), memory.stage("extract_structures"):
+        g_s, g_f, structures = extract_structures(data, *stream(opt.seed, EXTRACTION_STREAM))
 
     # logging.info("Num of structures before subset: {}".format(len(structures)))
     # structures = get_subset(structures)
@@ -241,53 +502,48 @@ if __name__ == '__main__':
     # minimize_combinations(structures + [g_s, g_f])
 
     selected = [s.id for s in structures]
-    logging.info("Selected structures: {}".format(selected))
+    logging.info("Selected structures: %s", selected)
 
     print("- Computing structure combinations")
-    structure_matching.compute_combinations(structures + [g_s, g_f])
+    with perf.timer("compute_combinations"), profiling.stage("compute_combinations"), \
+            memory.stage("compute_combinations"):
+        structure_matching.compute_combinations(structures + [g_s, g_f])
+    if opt.memory:
+        memory.add_library(structures + [g_s, g_f])
 
     print("- Saving structures")
-    save_structures(g_s, g_f, structures, structures_output_dir)
+    with perf.timer("save_structures"), profiling.stage("save_structures"), memory.stage("save_structures"):
+        save_structures(g_s, g_f, structures, structures_output_dir)
 
-    analyze_structures(structures_output_dir)
-    save_structures_data(f"output/{output_dir}/structures_data.csv")
+    with perf.timer("analyze_structures"), profiling.stage("analyze_structures"), memory.stage("analyze_structures"):
+        analyze_structures(structures_output_dir)
+        save_structures_data(f"output/{output_dir}/structures_data.csv")
 
     if opt.generate == "True":
-        for n in range(opt.output_number):
-            logging.info("Generating level {}".format(n))
-            print(f"Generating level {n}")
-
-            start_time = time.time()
-
-            try:
-                level, stats, structures_used, backtrack_count, used_stuctures = level_generation.generate_level(
-                    structures, g_s, g_f, opt.min_structures)
-            except EnvironmentError:
-                print("Environmet Error!")
-                continue
-
-            duration = time.time() - start_time
-
-            level_data = level.matrix_representation()
-            # print(*level_data, sep='\n')
-
-            generation_times.append(duration)
-            leniencies.append(calculate_leniency(level_data))
-            linearities.append(calculate_linearity(level_data))
-            line_distances.append(calculate_line_distance(level_data))
-            backtrackings.append(backtrack_count)
-
-            structures_used_list.append(structures_used)
-            structures_count_list.append(len(used_stuctures))
-            level_lengths.append(len(level_data[0]))
-            used_structures_list.append([s.id for s in used_stuctures])
-
-            level_path = f"{levels_output_dir}/level_{n}.txt"
-            level.save_as_level(level_path)
-
-            if opt.render == "True":
-                print("Rendering level {}".format(n))
-                render_structure(level_path, f"{levels_output_dir}/level_{n}.png")
-
-        save_data(f'output/{output_dir}')
-        # print(generation_times)
+        # metrics, levels and renders are written by the pipeline as levels come in
+        with perf.timer("generate_levels"), consumers(opt, output_dir, levels_output_dir) as stages:
+            if opt.workers <= 1:
+                generated_levels = pipeline.generate_levels(
+                    partial(generate, g_s=g_s, g_f=g_f, structures=structures, opt=opt), opt.output_number,
+                    proceed=memory_left)
+            else:
+                # each process receives the structure library once and sends its log records to the listener
+                generated_levels = pipeline.generate_levels(
+                    partial(generate_in_worker, opt=opt), opt.output_number, opt.workers, init_worker,
+                    (g_s, g_f, structures, opt, log_listener.queue, profiling.directory), proceed=memory_left)
+            stages.run(generated_levels)
+
+    # where the time of the run went, next to data_collected.csv
+    perf.save(f"output/{output_dir}/perf.json", options=vars(opt))
+
+    if opt.memory:
+        memory.save(f"output/{output_dir}/memory.json", options=vars(opt))
+        print("- Memory")
+        print(*memory.summary(), sep="\n")
+
+    if opt.profile:
+        # the levels were profiled one by one, sum them up as the generate stage
+        profiling.load("generate", "level_*", remove=not opt.profile_per_level)
+        profiling.dump()
+        print(f"- Hottest functions (profiles in output/{output_dir}/profiles)")
+        print(*profiling.top(), sep="\n")
@@ -2,7 +2,8 @@ import logging
 import os
 
 from sklearn.linear_model import LinearRegression
-from generator.constants import platform_tiles, enemy_tiles, powerup_tiles
+from generator.constants import enemy_tiles, powerup_tiles, is_solid, lookup_table
+from generator import tile_codec, bitboard
 from tools.render_level.render_level import parse_file
 from numpy import mean
 import numpy as np
@@ -18,10 +19,6 @@ pd.set_option('display.float_format', '{:.2f}'.format)
 # Set the Pandas display options to exclude count
 pd.set_option('display.show_dimensions', False)
 
-logging.basicConfig(filename="output/log.log",
-                    level=logging.DEBUG,
-                    filemode='w')
-
 LINE_HEIGHT: [int] = 2  # for some reason height closer to 0 produces higher linearity score?
 
 
@@ -31,19 +28,15 @@ def get_gaps(level_data: list[str]) -> list[int]:
     output: list of gaps, each number represents length in blocks.
     Len of this list is a number of gaps in the level
     """
-    last_row = level_data[-1]
-
-    gap_lengths = []
-    gap_length = 1
+    solid = bitboard.from_grid(is_solid[tile_codec.from_matrix(level_data)])
 
-    for block, next_block in zip(last_row, last_row[1:]):
-        if block not in platform_tiles:
-            if next_block not in platform_tiles:
-                gap_length += 1
-            else:
-                gap_lengths.append(gap_length)
-                gap_length = 1
-    return gap_lengths
+    # runs of non-platform tiles on the bottom row, only counted when a platform follows them
+    air = ~bitboard.row(solid, len(level_data) - 1)
+    edges = np.diff(np.concatenate(([0], air.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    closed = ends < len(solid)
+    return (ends[closed] - starts[closed]).tolist()
 
 
 def get_tiles(level_data: list[str], searched_tiles: list[str]) -> list[str]:
@@ -51,13 +44,8 @@ def get_tiles(level_data: list[str], searched_tiles: list[str]) -> list[str]:
     input: 2d array of characters representing the level
     output: list of characters found in level that belong to filter list
     """
-    powerups_found = []
-
-    for row in level_data:
-        for tile in row:
-            if tile in searched_tiles:
-                powerups_found.append(tile)
-    return powerups_found
+    grid = tile_codec.from_matrix(level_data)
+    return [chr(code) for code in grid[lookup_table(searched_tiles)[grid]]]
 
 
 def calculate_leniency(level_data: list[str]) -> float:
@@ -78,35 +66,28 @@ def calculate_leniency(level_data: list[str]) -> float:
     leniency += enemies_count * 1
     leniency += powerups_count * -1
 
-    logging.debug(f"gaps:{gaps}")
-    logging.debug(f"enemies: {enemies}")
-    logging.debug(f"powerups: {powerups}")
+    logging.debug("gaps:%s", gaps)
+    logging.debug("enemies: %s", enemies)
+    logging.debug("powerups: %s", powerups)
 
-    logging.debug(f"[gaps count] 0.5 * {gaps_count} = {0.5 * gaps_count}")
-    logging.debug(f"[average gap] 1 * {average_gap} = {average_gap}")
-    logging.debug(f"[enemies count] 1 * {enemies_count} = {enemies_count}")
-    logging.debug(f"[powerups count] -1 * {powerups_count} = {-powerups_count} ")
+    logging.debug("[gaps count] 0.5 * %s = %s", gaps_count, 0.5 * gaps_count)
+    logging.debug("[average gap] 1 * %s = %s", average_gap, average_gap)
+    logging.debug("[enemies count] 1 * %s = %s", enemies_count, enemies_count)
+    logging.debug("[powerups count] -1 * %s = %s ", powerups_count, -powerups_count)
 
-    logging.info(f"leniency = {leniency}")
+    logging.info("leniency = %s", leniency)
 
     return leniency
 
 
 def get_max_heights(level_data: list[str]) -> list[int]:
-    max_heights = [0] * len(level_data[0])
+    solid = bitboard.from_grid(is_solid[tile_codec.from_matrix(level_data)])
     level_height = len(level_data)
-    # print(f"max heights: {max_heights}")
-
-    # print(f"level height: {level_height}")
-    for y, row in enumerate(level_data):
-        for x, block in enumerate(row):
-            if max_heights[x] != 0:
-                continue
-            if block in platform_tiles:
-                max_heights[x] = level_height - y
-    # print(f"max heights: {max_heights}")
 
-    return max_heights
+    # height of the top-most platform tile of each column, 0 if there is none
+    top = bitboard.top_row(solid)
+    max_heights = np.where(top >= 0, level_height - top, 0)
+    return max_heights.tolist()
 
 
 def get_platform_heights(max_heights: list[int]) -> list[int]:
@@ -117,15 +98,15 @@ def get_platform_heights(max_heights: list[int]) -> list[int]:
     """
 
     platform_heights = []
-    logging.debug(f"max heights: {max_heights}")
+    logging.debug("max heights: %s", max_heights)
 
     for i, (height, next_height) in enumerate(zip(max_heights, max_heights[1:])):
         if height != next_height:
             platform_heights.append(height)
-            logging.debug(f"platform at height {height}")
+            logging.debug("platform at height %s", height)
         else:
             if i == len(max_heights) - 2:
-                logging.debug(f"last tile at height {next_height}")
+                logging.debug("last tile at height %s", next_height)
                 platform_heights.append(next_height)
 
     return platform_heights
@@ -144,7 +125,7 @@ def calculate_linearity(level_data: list[str]):
     max_heights = get_platform_heights(get_max_heights(level_data))
 
     y = np.array(max_heights)
-    logging.info(f"Max heights: {max_heights}")
+    logging.info("Max heights: %s", max_heights)
     x = np.array(list(range(len(y)))).reshape((-1, 1))
 
     model = LinearRegression().fit(x, y)
@@ -155,7 +136,7 @@ def calculate_linearity(level_data: list[str]):
     # print(f"slope: {model.coef_}")
 
     y_predict = model.predict(x)
-    logging.info(f"Predicted heights: {y_predict}")
+    logging.info("Predicted heights: %s", y_predict)
 
     # print(f"predicted: {y_predict}")
 
@@ -177,7 +158,7 @@ def plot(path: str, plot_title: str, data_frame):
 
         logging.info("")
         logging.info("")
-        logging.info(f"Analyzing {filename}")
+        logging.info("Analyzing %s", filename)
         level = parse_file(os.path.join(path, filename))
 
         leniencies.append(calculate_leniency(level))
@@ -208,36 +189,26 @@ def plot(path: str, plot_title: str, data_frame):
 
 
 structure_ids = []
-generation_times = []
 linearities = []
 leniencies = []
 line_distances = []
-structures_used_list = []
-structures_count_list = []
-backtrackings = []
-level_lengths = []
-used_structures_list = []
 
 df = pd.DataFrame(
-    columns=['time', 'leniency', 'linearity', 'line_distance', 'structures_used', 'structures_count', 'backtrackings', 'level_length', 'used_structures'])
+    columns=['time', 'leniency', 'linearity', 'line_distance', 'structures_used', 'structures_count', 'backtrackings', 'level_length', 'used_structures', 'stop_reason'])
 
 
 structures_frame = pd.DataFrame(
     columns=['id', 'leniency', 'linearity', 'line_distance'])
 
 
-def save_data(path: str):
-    df['time'] = generation_times
-    df['leniency'] = leniencies
-    df['linearity'] = linearities
-    df['line_distance'] = line_distances
-    df['structures_used'] = structures_used_list
-    df['structures_count'] = structures_count_list
-    df['backtrackings'] = backtrackings
-    df['level_length'] = level_lengths
-    df['used_structures'] = used_structures_list
-
-    df.to_csv(f'{path}/data_collected.csv', index=False)
+def append_data(path: str, collected: dict):
+    """
+    Write the values collected for one level as a row of the data_collected
+    csv at path, adding the header when the file is new, so rows reach the
+    disk as levels are generated
+    """
+    row = pd.DataFrame([[collected[column] for column in df.columns]], columns=df.columns)
+    row.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
 
 
 def save_structures_data(path: str):
@@ -266,8 +237,10 @@ def analyze_structures(path: Path):
 
 
 if __name__ == '__main__':
+    logging.basicConfig(filename="output/log.log",
+                        level=logging.DEBUG,
+                        filemode='w')
     analyze_structures(Path("../samples/level1_remix/structures"))
     save_structures_data(f'./output/data_collected.csv')
 # plot("../samples/level1_remix/structures/", "overlap", df)
 #   plot("../samples/no_overlap/levels/*.txt", "no_overlap", df)
-# save_data()